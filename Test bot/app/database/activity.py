@@ -0,0 +1,68 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.database.pool import acquire
+
+# Последняя активность пользователей, ещё не записанная в БД: {user_id: время}
+_pending: Dict[int, datetime] = {}
+_flusher: Optional[asyncio.Task] = None
+
+
+def touch(user_id: int, when: Optional[datetime] = None):
+    """Запоминает активность пользователя; в БД она попадёт при следующей записи"""
+    when = when or datetime.now()
+    previous = _pending.get(user_id)
+    if previous is None or previous < when:
+        _pending[user_id] = when
+
+
+async def flush() -> int:
+    """Записывает накопленную активность одним запросом, возвращает число пользователей"""
+    global _pending
+    if not _pending:
+        return 0
+
+    batch, _pending = _pending, {}
+    try:
+        async with acquire() as conn:
+            await conn.execute('''
+                UPDATE users u
+                SET last_activity_date = a.activity_date
+                FROM unnest($1::BIGINT[], $2::TIMESTAMP[]) AS a(user_id, activity_date)
+                WHERE u.user_id = a.user_id
+                  AND (u.last_activity_date IS NULL OR u.last_activity_date < a.activity_date)
+            ''', list(batch), list(batch.values()))
+    except Exception as e:
+        # Не теряем данные: вернём их в буфер до следующей попытки
+        for user_id, when in batch.items():
+            touch(user_id, when)
+        print(f"Ошибка записи активности пользователей: {e}")
+        return 0
+    return len(batch)
+
+
+async def _flush_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await flush()
+
+
+def start_activity_flusher(interval: Optional[float] = None):
+    """Запуск периодической записи активности (интервал в секундах)"""
+    global _flusher
+    if _flusher is not None:
+        return
+    interval = interval or float(os.getenv('ACTIVITY_FLUSH_INTERVAL', 30))
+    _flusher = asyncio.create_task(_flush_periodically(interval))
+
+
+async def stop_activity_flusher():
+    """Остановка с последней записью накопленной активности"""
+    global _flusher
+    if _flusher is not None:
+        task, _flusher = _flusher, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    await flush()
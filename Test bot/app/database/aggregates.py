@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+from app.database.pool import acquire
+from app.database.rates import conversion_table
+
+
+class CategoryTotal(NamedTuple):
+    category: str
+    total: float
+    count: int
+
+
+class OperationsSummary(NamedTuple):
+    """Итоги операций пользователя за период"""
+    income: float = 0.0
+    expense: float = 0.0
+    count: int = 0
+    income_by_category: Tuple[CategoryTotal, ...] = ()
+    expense_by_category: Tuple[CategoryTotal, ...] = ()
+
+    @property
+    def balance(self) -> float:
+        return self.income - self.expense
+
+    def by_type(self, op_type: str) -> Tuple[CategoryTotal, ...]:
+        return self.income_by_category if op_type == 'income' else self.expense_by_category
+
+
+def _midnight(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def period_start(period: Optional[str], now: Optional[datetime] = None) -> Optional[datetime]:
+    """Начало периода 'day' / 'week' / 'month' (None - за всё время)"""
+    if not period:
+        return None
+
+    now = now or datetime.now()
+    midnight = _midnight(now)
+    if period == 'day':
+        return midnight
+    if period == 'week':
+        return midnight - timedelta(days=now.weekday())
+    if period == 'month':
+        return midnight.replace(day=1)
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def _build_summary(rows) -> OperationsSummary:
+    """Сборка итогов из строк вида (level, type, category, total, count)"""
+    income = expense = 0.0
+    count = 0
+    categories = {'income': [], 'expense': []}
+    for row in rows:
+        level = row['level']
+        total = float(row['total'] or 0)
+        rows_count = int(row['count'] or 0)
+        if level == 'all':
+            count = rows_count
+        elif level == 'type':
+            if row['type'] == 'income':
+                income = total
+            else:
+                expense = total
+        elif row['type'] in categories:
+            categories[row['type']].append(CategoryTotal(row['category'], total, rows_count))
+
+    return OperationsSummary(
+        income=income,
+        expense=expense,
+        count=count,
+        income_by_category=tuple(categories['income']),
+        expense_by_category=tuple(categories['expense'])
+    )
+
+
+async def aggregate_operations(user_id: int,
+                               start: Optional[datetime] = None,
+                               end: Optional[datetime] = None,
+                               currency: str = 'RUB') -> OperationsSummary:
+    """
+    Итоги, суммы по типам и по категориям за период [start, end) в валюте
+    currency одним запросом. Без периода итоги берутся из user_category_totals;
+    для периода полные сутки берутся из дневных итогов operations_daily, а из
+    самих операций читаются только неполные сутки на границах периода.
+    Суммы группируются по валюте операции и конвертируются по одному
+    множителю на валюту из снимка курсов. Категории внутри типа отсортированы по убыванию суммы.
+    """
+    params = [user_id]
+
+    def param(value) -> str:
+        params.append(value)
+        return f'${len(params)}'
+
+    sources = []
+    raw_ranges = []
+    if start is None and end is None:
+        sources.append('''
+            SELECT type, category, currency, total, count
+            FROM user_category_totals
+            WHERE user_id = $1
+        ''')
+    else:
+        # Полные сутки периода: [full_from, full_to)
+        full_from = None
+        if start is not None:
+            full_from = start if start == _midnight(start) else _midnight(start) + timedelta(days=1)
+        full_to = _midnight(end) if end is not None else None
+
+        if full_from is not None and full_to is not None and full_from >= full_to:
+            # Период целиком внутри одних суток
+            raw_ranges.append((start, end))
+        else:
+            conditions = ['user_id = $1']
+            if full_from is not None:
+                conditions.append(f'day >= {param(full_from.date())}')
+            if full_to is not None:
+                conditions.append(f'day < {param(full_to.date())}')
+            sources.append(f'''
+                SELECT type, category, currency, total, count
+                FROM operations_daily
+                WHERE {' AND '.join(conditions)}
+            ''')
+            if start is not None and start < full_from:
+                raw_ranges.append((start, full_from))
+            if end is not None and full_to < end:
+                raw_ranges.append((full_to, end))
+
+    for range_start, range_end in raw_ranges:
+        sources.append(f'''
+            SELECT type, COALESCE(category, '') AS category, currency, amount AS total, 1 AS count
+            FROM operations
+            WHERE user_id = $1
+              AND operation_date >= {param(range_start)}
+              AND operation_date < {param(range_end)}
+        ''')
+
+    codes, factors = conversion_table(currency)
+    async with acquire() as conn:
+        rows = await conn.fetch(f'''
+        SELECT
+            CASE GROUPING(type, category)
+                WHEN 3 THEN 'all'
+                WHEN 1 THEN 'type'
+                ELSE 'category'
+            END AS level,
+            type,
+            category,
+            SUM(total) AS total,
+            SUM(count) AS count
+        FROM (
+            -- Один множитель на валюту из снимка курсов
+            SELECT
+                grouped.type,
+                grouped.category,
+                grouped.total * COALESCE(rate.factor, 1) AS total,
+                grouped.count
+            FROM (
+                SELECT type, category, currency, SUM(total) AS total, SUM(count) AS count
+                FROM ({' UNION ALL '.join(sources)}) src
+                GROUP BY type, category, currency
+            ) grouped
+            LEFT JOIN unnest({param(codes)}::TEXT[], {param(factors)}::NUMERIC[]) AS rate(code, factor)
+                ON rate.code = grouped.currency
+        ) converted
+        GROUP BY GROUPING SETS ((), (type), (type, category))
+        ORDER BY type, total DESC
+        ''', *params)
+    return _build_summary(rows)
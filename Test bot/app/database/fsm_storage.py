@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from app.database.cache import TTLCache
+from app.database.pool import acquire
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в таблице fsm_states.
+
+    Чтение идёт из кэша процесса, запись сразу попадает в кэш и копится в
+    буфере, который записывается в БД одним запросом раз в flush_interval
+    секунд (и при закрытии). Диалоги, не менявшиеся дольше state_ttl секунд,
+    считаются брошенными и удаляются.
+
+    Кэш корректен, пока апдейты одного пользователя обрабатывает один
+    процесс (при нескольких процессах апдейты распределяются по user_id).
+    """
+
+    def __init__(self, flush_interval: float = 1.0, state_ttl: float = 86400,
+                 cache_size: int = 10000, cache_ttl: float = 600):
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache = TTLCache(maxsize=cache_size, ttl=min(cache_ttl, state_ttl))
+        # Несохранённые записи: {ключ: (state, data, data в JSON)}; (None, {}, ...) - удалить
+        self._pending: Dict[str, tuple] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+
+    @classmethod
+    def from_env(cls) -> 'PostgresStorage':
+        return cls(
+            flush_interval=float(os.getenv('FSM_FLUSH_INTERVAL', 1)),
+            state_ttl=float(os.getenv('FSM_STATE_TTL', 86400)),
+            cache_size=int(os.getenv('FSM_CACHE_SIZE', 10000)),
+            cache_ttl=float(os.getenv('FSM_CACHE_TTL', 600)),
+        )
+
+    async def _load(self, key: str) -> tuple:
+        record = self._pending.get(key)
+        if record is not None:
+            return record[:2]
+        record = self._cache.get(key)
+        if record is not None:
+            return record
+
+        async with acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT state, data FROM fsm_states
+                WHERE key = $1 AND updated_at > NOW() - make_interval(secs => $2)
+            ''', key, self.state_ttl)
+        record = (row['state'], json.loads(row['data'])) if row else (None, {})
+        self._cache.set(key, record)
+        return record
+
+    def _store(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        # Сериализуем сразу: данные, которые нельзя записать в JSON, - ошибка
+        # обработчика, вызвавшего set_data, а не общей записи в фоне
+        data_json = json.dumps(data, ensure_ascii=False)
+        self._cache.set(key, (state, data))
+        self._pending[key] = (state, data, data_json)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key_builder.build(key)
+        _, data = await self._load(key)
+        self._store(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = self._key_builder.build(key)
+        state, _ = await self._load(key)
+        self._store(key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key_builder.build(key))
+        return dict(data)
+
+    async def flush(self):
+        """Запись накопленных изменений: одно upsert и одно удаление"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+
+        upserts = {key: record for key, record in batch.items() if record[0] is not None or record[1]}
+        deletes = [key for key in batch if key not in upserts]
+        try:
+            async with acquire() as conn:
+                async with conn.transaction():
+                    if upserts:
+                        await conn.execute('''
+                            INSERT INTO fsm_states (key, state, data, updated_at)
+                            SELECT key, state, data::JSONB, NOW()
+                            FROM unnest($1::TEXT[], $2::TEXT[], $3::TEXT[]) AS s(key, state, data)
+                            ON CONFLICT (key) DO UPDATE
+                            SET state = EXCLUDED.state,
+                                data = EXCLUDED.data,
+                                updated_at = NOW()
+                        ''', list(upserts), [state for state, _, _ in upserts.values()],
+                            [data_json for _, _, data_json in upserts.values()])
+                    if deletes:
+                        await conn.execute('DELETE FROM fsm_states WHERE key = ANY($1::TEXT[])', deletes)
+        except Exception as e:
+            # Более новые записи, сделанные во время запроса, не перезаписываем
+            for key, record in batch.items():
+                self._pending.setdefault(key, record)
+            print(f"Ошибка записи состояний FSM: {e}")
+
+    async def cleanup(self):
+        """Удаление брошенных диалогов"""
+        async with acquire() as conn:
+            await conn.execute(
+                'DELETE FROM fsm_states WHERE updated_at < NOW() - make_interval(secs => $1)',
+                self.state_ttl
+            )
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - self._last_cleanup > min(self.state_ttl, 3600):
+                self._last_cleanup = time.monotonic()
+                try:
+                    await self.cleanup()
+                except Exception as e:
+                    print(f"Ошибка очистки состояний FSM: {e}")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            task, self._flusher = self._flusher, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
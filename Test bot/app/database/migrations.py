@@ -0,0 +1,307 @@
+"""
+Версионированные миграции схемы БД.
+
+Каждая миграция применяется один раз в собственной транзакции и
+записывается в schema_migrations. При запуске, если схема актуальна,
+выполняется только проверка версии. Несколько процессов бота не применяют
+миграции одновременно: применение защищено advisory-блокировкой.
+"""
+import os
+from datetime import datetime
+
+import asyncpg
+
+from app.database.models import rebuild_daily_rollup, rebuild_ledger
+from app.database.partitions import ensure_month_partitions
+from app.database.pool import acquire
+
+# Ключ advisory-блокировки на время применения миграций
+MIGRATIONS_LOCK_ID = 726354001
+
+
+async def _table_has_column(conn, table: str, column: str) -> bool:
+    return await conn.fetchval('''
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = $1 AND column_name = $2
+        )
+    ''', table, column)
+
+
+async def _create_base_schema(conn):
+    """Исходная схема бота"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            registration_date TIMESTAMP,
+            last_activity_date TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS operations (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id),
+            type TEXT CHECK(type IN ('income', 'expense')),
+            amount DECIMAL(12, 2),
+            category TEXT,
+            comment TEXT,
+            operation_date TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_operations_user ON operations(user_id);
+        CREATE INDEX IF NOT EXISTS idx_operations_date ON operations(operation_date);
+
+        CREATE TABLE IF NOT EXISTS currencies (
+            code TEXT PRIMARY KEY,
+            rate_to_rub DECIMAL(10, 4),
+            updated_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+            currency TEXT DEFAULT 'RUB',
+            original_currency TEXT DEFAULT 'RUB',
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        -- Базовые курсы (примерные)
+        INSERT INTO currencies (code, rate_to_rub, updated_at)
+        VALUES
+            ('RUB', 1.0, NOW()),
+            ('USD', 0.011, NOW()),
+            ('EUR', 0.0095, NOW())
+        ON CONFLICT (code) DO NOTHING;
+
+        CREATE TABLE IF NOT EXISTS user_languages (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+            language_code TEXT DEFAULT 'ru',
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS user_notifications (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+            enabled BOOLEAN DEFAULT TRUE,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+            username TEXT,
+            added_at TIMESTAMP DEFAULT NOW(),
+            is_superadmin BOOLEAN DEFAULT FALSE
+        );
+
+        CREATE TABLE IF NOT EXISTS goals (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id),
+            name TEXT NOT NULL,
+            target_amount DECIMAL(12, 2) NOT NULL,
+            current_amount DECIMAL(12, 2) DEFAULT 0,
+            deadline TIMESTAMP,
+            is_completed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_goals_user ON goals(user_id);
+    ''')
+
+
+async def _add_operation_currency(conn):
+    """Валюта операции: суммы хранятся в исходной валюте и конвертируются при чтении"""
+    if await _table_has_column(conn, 'operations', 'currency'):
+        return
+    await conn.execute('''
+        ALTER TABLE operations ADD COLUMN currency TEXT NOT NULL DEFAULT 'RUB'
+    ''')
+    # Раньше суммы пересчитывались в текущую валюту пользователя
+    await conn.execute('''
+        UPDATE operations o
+        SET currency = s.currency
+        FROM user_settings s
+        WHERE s.user_id = o.user_id AND s.currency <> 'RUB'
+    ''')
+
+
+async def _create_category_totals(conn):
+    """Накопительные итоги по пользователю (обновляются вместе со вставкой операции)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_category_totals (
+            user_id BIGINT REFERENCES users(user_id),
+            type TEXT CHECK(type IN ('income', 'expense')),
+            category TEXT,
+            currency TEXT,
+            total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, type, category, currency)
+        )
+    ''')
+    # Заполняем итоги по уже существующим операциям
+    await rebuild_ledger(conn)
+
+
+async def _create_daily_rollup(conn):
+    """Дневные итоги для отчётов за день/неделю/месяц"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS operations_daily (
+            user_id BIGINT REFERENCES users(user_id),
+            day DATE,
+            type TEXT CHECK(type IN ('income', 'expense')),
+            category TEXT,
+            currency TEXT,
+            total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, type, category, currency)
+        )
+    ''')
+    await rebuild_daily_rollup(conn)
+
+
+async def _widen_currency_rates(conn):
+    """Курсы слабых к рублю валют не помещались в 4 знака после запятой"""
+    await conn.execute('ALTER TABLE currencies ALTER COLUMN rate_to_rub TYPE DECIMAL(18, 8)')
+
+
+async def _partition_operations(conn):
+    """
+    Помесячное секционирование operations по operation_date. Данные
+    переносятся из старой таблицы; первичный ключ секционированной таблицы
+    обязан включать ключ секционирования, поэтому он (id, operation_date).
+
+    Перенос идёт одним INSERT в транзакции миграции: до его окончания запись
+    в operations и запуск остальных процессов бота заблокированы. На большой
+    таблице миграцию выполняют при остановленном боте (см. instruction.txt).
+    """
+    if await conn.fetchval("SELECT relkind = 'p' FROM pg_class WHERE oid = 'operations'::regclass"):
+        return
+
+    await conn.execute('''
+        ALTER TABLE operations RENAME TO operations_legacy;
+        ALTER SEQUENCE operations_id_seq OWNED BY NONE AS BIGINT;
+        DROP INDEX IF EXISTS idx_operations_user;
+        DROP INDEX IF EXISTS idx_operations_date;
+
+        CREATE TABLE operations (
+            id BIGINT NOT NULL DEFAULT nextval('operations_id_seq'),
+            user_id BIGINT REFERENCES users(user_id),
+            type TEXT CHECK(type IN ('income', 'expense')),
+            amount DECIMAL(12, 2),
+            category TEXT,
+            comment TEXT,
+            operation_date TIMESTAMP NOT NULL,
+            currency TEXT NOT NULL DEFAULT 'RUB',
+            PRIMARY KEY (id, operation_date)
+        ) PARTITION BY RANGE (operation_date);
+        ALTER SEQUENCE operations_id_seq OWNED BY operations.id;
+
+        -- Запросы по пользователю всегда ограничены периодом или читают все секции
+        CREATE INDEX idx_operations_user_date ON operations(user_id, operation_date);
+
+        CREATE TABLE operations_default PARTITION OF operations DEFAULT;
+    ''')
+
+    print("Перенос операций в секционированную таблицу: запись в operations заблокирована до окончания миграции")
+
+    first_day = await conn.fetchval('SELECT MIN(operation_date)::DATE FROM operations_legacy')
+    await ensure_month_partitions(conn, first_day or datetime.now().date(),
+                                  int(os.getenv('OPERATIONS_PARTITIONS_AHEAD', 3)))
+
+    # Операции без даты (в старой схеме дата не была обязательной) попадают в секцию по умолчанию
+    await conn.execute('''
+        INSERT INTO operations (id, user_id, type, amount, category, comment, operation_date, currency)
+        SELECT id, user_id, type, amount, category, comment,
+               COALESCE(operation_date, 'epoch'::TIMESTAMP), currency
+        FROM operations_legacy
+    ''')
+    await conn.execute('DROP TABLE operations_legacy')
+
+
+async def _create_fsm_states(conn):
+    """Состояния диалогов FSM (см. app/database/fsm_storage.py)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);
+    ''')
+
+
+async def _create_pomodoro_sessions(conn):
+    """Сессии помидорки: текущая фаза и время следующего переключения (см. app/pomodoro.py)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS pomodoro_sessions (
+            user_id BIGINT PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            language TEXT NOT NULL DEFAULT 'ru',
+            phase TEXT NOT NULL CHECK(phase IN ('work', 'break')),
+            fire_at TIMESTAMPTZ NOT NULL
+        )
+    ''')
+
+
+# (версия, описание, применение). Новые миграции добавляются только в конец.
+MIGRATIONS = (
+    (1, 'base schema', _create_base_schema),
+    (2, 'operations.currency', _add_operation_currency),
+    (3, 'user_category_totals', _create_category_totals),
+    (4, 'operations_daily', _create_daily_rollup),
+    (5, 'currencies.rate_to_rub DECIMAL(18, 8)', _widen_currency_rates),
+    (6, 'operations partitioned by month', _partition_operations),
+    (7, 'fsm_states', _create_fsm_states),
+    (8, 'pomodoro_sessions', _create_pomodoro_sessions),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def _current_version(conn) -> int:
+    try:
+        return await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(conn) -> int:
+    """Применяет недостающие миграции, возвращает число применённых"""
+    if await _current_version(conn) >= LATEST_VERSION:
+        return 0
+
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATIONS_LOCK_ID)
+    try:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        current = await _current_version(conn)
+
+        applied = 0
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            async with conn.transaction():
+                await apply(conn)
+                await conn.execute(
+                    'INSERT INTO schema_migrations (version, description) VALUES ($1, $2)',
+                    version, description
+                )
+            print(f"Применена миграция {version}: {description}")
+            applied += 1
+        return applied
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATIONS_LOCK_ID)
+
+
+async def init_db():
+    """Инициализация базы данных"""
+    try:
+        async with acquire() as conn:
+            await migrate(conn)
+            print("База данных успешно инициализирована")
+    except Exception as e:
+        print(f"Ошибка инициализации БД PostgreSQL: {str(e)}")
+        raise
@@ -1,158 +1,36 @@
 import os
-import csv
+import time
+import asyncio
+import hashlib
+import tempfile
 import aiohttp
-from io import BytesIO
-import pandas as pd
-from aiogram import Bot
-import asyncpg
-import aiofiles
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+import xlsxwriter
+from aiogram.types import BufferedInputFile
+from datetime import datetime
+from typing import List, Dict, Any, BinaryIO, Optional, Tuple
 from decimal import Decimal, InvalidOperation
+from dotenv import load_dotenv
 
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB лимит Telegram
-
-
-async def init_db():
-    """Инициализация базы данных"""
-    try:
-        # Подключение к PostgreSQL
-        conn = await asyncpg.connect(
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT')
-        )
-
-        # Создание таблицы пользователей
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                registration_date TIMESTAMP,
-                last_activity_date TIMESTAMP
-            )
-        ''')
-
-        # Создание таблицы операций
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS operations (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                type TEXT CHECK(type IN ('income', 'expense')),
-                amount DECIMAL(12, 2),
-                category TEXT,
-                comment TEXT,
-                operation_date TIMESTAMP
-            )
-        ''')
-
-        # Создание индексов
-        await conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_operations_user 
-            ON operations(user_id)
-        ''')
-        await conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_operations_date 
-            ON operations(operation_date)
-        ''')
-
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS currencies (
-                code TEXT PRIMARY KEY,
-                rate_to_rub DECIMAL(10, 4),
-                updated_at TIMESTAMP
-            )
-            ''')
+from app.database import activity
+from app.database.aggregates import aggregate_operations, period_start
+from app.database.cache import TTLCache
+from app.database.pool import acquire
+from app.database.rates import conversion_table, get_rates, set_rates
 
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_settings (
-                user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
-                currency TEXT DEFAULT 'RUB',
-                original_currency TEXT DEFAULT 'RUB',
-                updated_at TIMESTAMP DEFAULT NOW()
-            )
-            ''')
-
-        # Вставляем базовые курсы (примерные)
-        await conn.execute('''
-            INSERT INTO currencies (code, rate_to_rub, updated_at)
-            VALUES 
-                ('RUB', 1.0, NOW()),
-                ('USD', 0.011, NOW()),
-                ('EUR', 0.0095, NOW())
-            ON CONFLICT (code) DO NOTHING
-            ''')
-
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_languages (
-                user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
-                language_code TEXT DEFAULT 'ru',
-                updated_at TIMESTAMP DEFAULT NOW()
-            )
-            ''')
-
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_notifications (
-                user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
-                enabled BOOLEAN DEFAULT TRUE,
-                updated_at TIMESTAMP DEFAULT NOW()
-            )
-            ''')
-        
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS admins (
-                user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
-                username TEXT,
-                added_at TIMESTAMP DEFAULT NOW(),
-                is_superadmin BOOLEAN DEFAULT FALSE
-            )
-        ''')
-
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS goals (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                name TEXT NOT NULL,
-                target_amount DECIMAL(12, 2) NOT NULL,
-                current_amount DECIMAL(12, 2) DEFAULT 0,
-                deadline TIMESTAMP,
-                is_completed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-
-        await conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_goals_user 
-            ON goals(user_id)
-        ''')
-
-        print("База данных успешно инициализирована")
-    except Exception as e:
-        print(f"Ошибка инициализации БД PostgreSQL: {str(e)}")
-        raise
-    finally:
-        if conn:
-            await conn.close()
+load_dotenv()
 
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB лимит Telegram
 
-async def get_connection():
-    return await asyncpg.connect(
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        database=os.getenv('DB_NAME'),
-        host=os.getenv('DB_HOST'),
-        port=int(os.getenv('DB_PORT', 5432))
-    )
+# Кэш профилей пользователей: язык, валюта, уведомления, права администратора
+_profiles = TTLCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('PROFILE_CACHE_TTL', 600))
+)
 
 
 async def add_user(user_id: int, username: str, first_name: str, last_name: str):
     """Добавление нового пользователя"""
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         now = datetime.now()
         await conn.execute(
             '''
@@ -163,219 +41,299 @@ async def add_user(user_id: int, username: str, first_name: str, last_name: str)
             ''',
             user_id, username, first_name, last_name, now
         )
-    finally:
-        await conn.close()
 
 
 async def update_user_activity(user_id: int):
-    """Обновление даты последней активности пользователя"""
-    conn = await get_connection()
-    try:
-        now = datetime.now()
-        await conn.execute(
-            '''
-            UPDATE users 
-            SET last_activity_date = $1
-            WHERE user_id = $2
-            ''',
-            now, user_id
-        )
-    finally:
-        await conn.close()
-
-
-async def get_operations(user_id: int, period: str = None) -> List[Tuple]:
-    """Получение операций пользователя"""
-    conn = await get_connection()
-    try:
-        query = '''
-        SELECT type, amount, category, comment, operation_date 
-        FROM operations 
-        WHERE user_id = $1
-        '''
-        params = [user_id]
-
-        if period:
-            now = datetime.now()
-            if period == 'day':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'week':
-                start_date = now - timedelta(days=now.weekday())
-                start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'month':
-                start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-            query += ' AND operation_date >= $2'
-            params.append(start_date)
-
-        return await conn.fetch(query, *params)
-    finally:
-        await conn.close()
+    """
+    Обновление даты последней активности пользователя. Дата копится в
+    памяти и записывается в БД пакетом (см. app.database.activity).
+    """
+    activity.touch(user_id)
+
+
+# ---- Накопительные итоги (баланс) ----
+async def apply_operation_to_ledger(conn, user_id: int, op_type: str, amount, category: str,
+                                    currency: str, operation_date: datetime):
+    """Учёт новой операции в итогах пользователя (вызывать в транзакции вставки)"""
+    await conn.execute('''
+        INSERT INTO user_category_totals (user_id, type, category, currency, total, count)
+        VALUES ($1, $2, $3, $4, $5, 1)
+        ON CONFLICT (user_id, type, category, currency) DO UPDATE
+        SET total = user_category_totals.total + EXCLUDED.total,
+            count = user_category_totals.count + 1
+    ''', user_id, op_type, category or '', currency, amount)
+
+    await conn.execute('''
+        INSERT INTO operations_daily (user_id, day, type, category, currency, total, count)
+        VALUES ($1, $2, $3, $4, $5, $6, 1)
+        ON CONFLICT (user_id, day, type, category, currency) DO UPDATE
+        SET total = operations_daily.total + EXCLUDED.total,
+            count = operations_daily.count + 1
+    ''', user_id, operation_date.date(), op_type, category or '', currency, amount)
+
+
+async def rebuild_ledger(conn, user_id: Optional[int] = None):
+    """Пересчёт итогов из таблицы операций (для всех или одного пользователя)"""
+    user_filter = 'WHERE user_id = $1' if user_id is not None else ''
+    params = [user_id] if user_id is not None else []
+
+    await conn.execute(f'DELETE FROM user_category_totals {user_filter}', *params)
+    await conn.execute(f'''
+        INSERT INTO user_category_totals (user_id, type, category, currency, total, count)
+        SELECT user_id, type, COALESCE(category, ''), currency, COALESCE(SUM(amount), 0), COUNT(*)
+        FROM operations
+        {user_filter}
+        GROUP BY user_id, type, COALESCE(category, ''), currency
+    ''', *params)
+
+
+async def rebuild_daily_rollup(conn, user_id: Optional[int] = None):
+    """Пересчёт дневных итогов operations_daily из таблицы операций"""
+    user_filter = 'WHERE user_id = $1' if user_id is not None else ''
+    params = [user_id] if user_id is not None else []
+
+    await conn.execute(f'DELETE FROM operations_daily {user_filter}', *params)
+    # Операции без даты не относятся ни к одному дню
+    await conn.execute(f'''
+        INSERT INTO operations_daily (user_id, day, type, category, currency, total, count)
+        SELECT user_id, operation_date::DATE, type, COALESCE(category, ''), currency,
+               COALESCE(SUM(amount), 0), COUNT(*)
+        FROM operations
+        {user_filter or 'WHERE TRUE'} AND operation_date IS NOT NULL
+        GROUP BY user_id, operation_date::DATE, type, COALESCE(category, ''), currency
+    ''', *params)
 
 
 async def get_user_stats(user_id: int) -> Dict[str, Any]:
     """Получение статистики пользователя"""
-    conn = await get_connection()
-    try:
-        # Общая статистика
-        stats = await conn.fetchrow('''
-        SELECT 
-            COUNT(*) as total_ops,
-            SUM(CASE WHEN type='income' THEN amount ELSE 0 END) as total_income,
-            SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) as total_expense
-        FROM operations
-        WHERE user_id = $1
-        ''', user_id)
-
-        result = {
-            'total_operations': stats['total_ops'] if stats['total_ops'] else 0,
-            'total_income': float(stats['total_income']) if stats['total_income'] else 0.0,
-            'total_expense': float(stats['total_expense']) if stats['total_expense'] else 0.0
+    profile = await get_user_profile(user_id)
+    summary = await aggregate_operations(user_id, currency=profile['currency'])
+    return {
+        'total_operations': summary.count,
+        'total_income': summary.income,
+        'total_expense': summary.expense,
+        'categories': {
+            op_type: [
+                {'category': cat.category, 'count': cat.count, 'sum': cat.total}
+                for cat in summary.by_type(op_type)
+            ]
+            for op_type in ('income', 'expense')
+            if summary.by_type(op_type)
         }
+    }
 
-        # Статистика по категориям
-        rows = await conn.fetch('''
-        SELECT 
-            type, 
-            category,
-            COUNT(*) as count,
-            SUM(amount) as sum
-        FROM operations
-        WHERE user_id = $1
-        GROUP BY type, category
-        ORDER BY type, sum DESC
-        ''', user_id)
 
-        result['categories'] = {}
-        for row in rows:
-            op_type = row['type']
-            category = row['category']
-            if op_type not in result['categories']:
-                result['categories'][op_type] = []
-            result['categories'][op_type].append({
-                'category': category,
-                'count': row['count'],
-                'sum': float(row['sum'])
-            })
-
-        return result
-    finally:
-        await conn.close()
+class ExportTooLargeError(Exception):
+    """Файл экспорта превышает лимит Telegram"""
 
 
-async def export_to_csv(user_id: int) -> Optional[str]:
-    """Экспорт операций в CSV файл"""
+async def export_to_csv(user_id: int) -> Optional[BufferedInputFile]:
+    """
+    Экспорт операций в CSV без временных файлов: строки потоково
+    выгружаются через COPY ... TO STDOUT в буфер в памяти.
+    Размер буфера ограничен MAX_FILE_SIZE.
+    """
+    currency = (await get_user_profile(user_id))['currency']
+    codes, factors = conversion_table(currency)
+    header = f'Дата,Тип,Категория,Сумма,Валюта,Сумма ({currency}),Комментарий\n'
+    buffer = bytearray(header.encode('utf-8'))
+    too_large = False
+
+    async def write_chunk(chunk: bytes):
+        # Прервать COPY из обработчика нельзя без разрыва соединения,
+        # поэтому после превышения лимита остаток просто отбрасывается
+        nonlocal too_large
+        if too_large or len(buffer) + len(chunk) > MAX_FILE_SIZE:
+            too_large = True
+            return
+        buffer.extend(chunk)
+
     try:
-        operations = await get_operations(user_id)
-        if not operations:
-            return None
-
-        filename = f"temp/export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        os.makedirs('temp', exist_ok=True)
-
-        async with aiofiles.open(filename, mode='w', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file)
-            await writer.writerow(['Дата', 'Тип', 'Категория', 'Сумма', 'Комментарий'])
-            for op in operations:
-                await writer.writerow([
-                    op['operation_date'],  # Дата
-                    'Доход' if op['type'] == 'income' else 'Расход',
-                    op['category'],  # Категория
-                    op['amount'],  # Сумма
-                    op['comment']  # Комментарий
-                ])
-
-        return filename
+        async with acquire() as conn:
+            status = await conn.copy_from_query(
+                '''
+                SELECT
+                    o.operation_date,
+                    CASE WHEN o.type = 'income' THEN 'Доход' ELSE 'Расход' END,
+                    o.category,
+                    o.amount,
+                    o.currency,
+                    ROUND(o.amount * COALESCE(rate.factor, 1), 2),
+                    o.comment
+                FROM operations o
+                LEFT JOIN unnest($2::TEXT[], $3::NUMERIC[]) AS rate(code, factor)
+                    ON rate.code = o.currency
+                WHERE o.user_id = $1
+                ORDER BY o.operation_date
+                ''',
+                user_id,
+                codes,
+                factors,
+                output=write_chunk,
+                format='csv'
+            )
     except Exception as e:
         print(f"Export error: {e}")
         return None
 
+    if status == 'COPY 0':
+        return None
+    if too_large:
+        raise ExportTooLargeError(f"Экспорт пользователя {user_id} больше {MAX_FILE_SIZE} байт")
 
-async def get_currency_rate(currency: str) -> Decimal:
-    conn = await get_connection()
-    try:
-        rate = await conn.fetchval(
-            'SELECT rate_to_rub FROM currencies WHERE code = $1',
-            currency
-        )
-        return Decimal(rate) if rate else Decimal(1)
-    finally:
-        await conn.close()
+    filename = f"export_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return BufferedInputFile(bytes(buffer), filename=filename)
 
 
-async def set_user_currency(user_id: int, currency: str):
-    conn = await get_connection()
-    try:
-        original_currency = await conn.fetchval(
-            'SELECT original_currency FROM user_settings WHERE user_id = $1',
-            user_id
-        ) or 'RUB'
+async def get_user_profile(user_id: int) -> Dict[str, Any]:
+    """
+    Настройки пользователя одним запросом (с кэшированием).
+    Возвращаемый словарь общий для кэша - не изменяйте его.
+    """
+    profile = _profiles.get(user_id)
+    if profile is not None:
+        return profile
+
+    async with acquire() as conn:
+        row = await conn.fetchrow('''
+        SELECT
+            l.language_code,
+            s.currency,
+            s.original_currency,
+            n.enabled,
+            a.user_id IS NOT NULL AS is_admin,
+            COALESCE(a.is_superadmin, FALSE) AS is_superadmin
+        FROM (SELECT $1::BIGINT AS user_id) u
+        LEFT JOIN user_languages l ON l.user_id = u.user_id
+        LEFT JOIN user_settings s ON s.user_id = u.user_id
+        LEFT JOIN user_notifications n ON n.user_id = u.user_id
+        LEFT JOIN admins a ON a.user_id = u.user_id
+        ''', user_id)
+
+    profile = {
+        'language': row['language_code'] or 'ru',
+        'currency': row['currency'] or 'RUB',
+        'original_currency': row['original_currency'] or 'RUB',
+        'notifications': row['enabled'] if row['enabled'] is not None else True,  # По умолчанию включены
+        'is_admin': row['is_admin'],
+        'is_superadmin': row['is_superadmin'],
+    }
+    _profiles.set(user_id, profile)
+    return profile
 
+
+async def set_user_currency(user_id: int, currency: str):
+    async with acquire() as conn:
         await conn.execute('''
         INSERT INTO user_settings (user_id, currency, original_currency)
-        VALUES ($1, $2, $3)
+        VALUES ($1, $2, 'RUB')
         ON CONFLICT (user_id) DO UPDATE
         SET currency = EXCLUDED.currency,
             updated_at = NOW()
-        ''', user_id, currency, original_currency)
-    finally:
-        await conn.close()
+        ''', user_id, currency)
+    _profiles.update(user_id, currency=currency)
 
 
 async def get_user_currency_settings(user_id: int) -> dict:
-    conn = await get_connection()
-    try:
-        return await conn.fetchrow(
-            'SELECT currency, original_currency FROM user_settings WHERE user_id = $1',
-            user_id
-        ) or {'currency': 'RUB', 'original_currency': 'RUB'}
-    finally:
-        await conn.close()
+    profile = await get_user_profile(user_id)
+    return {'currency': profile['currency'], 'original_currency': profile['original_currency']}
+
+# Состояние ленты курсов ЦБ РФ для условной загрузки
+CBR_RATES_URL = os.getenv('CBR_RATES_URL', 'https://www.cbr.ru/scripts/XML_daily.asp')
+CBR_RATES_TIMEOUT = float(os.getenv('CBR_RATES_TIMEOUT', 10))
+_rates_feed = {'etag': None, 'last_modified': None, 'digest': None}
+
 
-async def update_currency_rates():
+def _parse_cbr_rates(content: bytes) -> Dict[str, Decimal]:
+    """
+    Разбор XML ЦБ РФ. В ленте указано, сколько рублей стоит Nominal единиц
+    валюты, а в currencies.rate_to_rub хранится, сколько единиц валюты дают
+    за один рубль - поэтому курс переворачивается.
+    """
+    from xml.etree import ElementTree as ET
+    root = ET.fromstring(content)
+
+    rates = {'RUB': Decimal('1.0')}  # RUB всегда равен 1
+    for valute in root.findall('Valute'):
+        char_code = valute.find('CharCode').text
+        value = valute.find('Value').text.replace(',', '.')
+        nominal = valute.find('Nominal').text
+        try:
+            rates[char_code] = (Decimal(nominal) / Decimal(value)).quantize(Decimal('1e-8'))
+        except (InvalidOperation, TypeError, ZeroDivisionError):
+            continue
+    return rates
+
+
+async def update_currency_rates() -> Dict[str, Any]:
     """
-    Получает актуальные курсы валют с сайта ЦБ РФ и сохраняет их в БД.
+    Получает актуальные курсы валют с сайта ЦБ РФ и сохраняет изменившиеся в БД.
+    Повторная загрузка не выполняется, если лента не изменилась (ETag /
+    Last-Modified), а неизменившийся ответ не разбирается повторно (хеш).
+    Возвращает статус, число изменённых курсов и длительность обновления.
     """
-    url = "https://www.cbr.ru/scripts/XML_daily.asp "
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                print(f"Ошибка загрузки курсов: {response.status}")
-                return
-
-            text = await response.text()
-            from xml.etree import ElementTree as ET
-            root = ET.fromstring(text)
-
-            rates = {'RUB': Decimal('1.0')}  # RUB всегда равен 1
-
-            for valute in root.findall('Valute'):
-                char_code = valute.find('CharCode').text
-                value = valute.find('Value').text.replace(',', '.')
-                nominal = valute.find('Nominal').text
-                try:
-                    rate_rub = Decimal(value) / Decimal(nominal)
-                    rates[char_code] = rate_rub
-                except (InvalidOperation, TypeError):
-                    continue
-
-            conn = await get_connection()
-            try:
-                for currency, rate in rates.items():
+    started = time.perf_counter()
+    result = {'status': 'updated', 'changed': 0}
+    content = None
+    validators = {}
+
+    headers = {}
+    if _rates_feed['etag']:
+        headers['If-None-Match'] = _rates_feed['etag']
+    if _rates_feed['last_modified']:
+        headers['If-Modified-Since'] = _rates_feed['last_modified']
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=CBR_RATES_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(CBR_RATES_URL, headers=headers) as response:
+                if response.status == 304:
+                    result['status'] = 'not_modified'
+                elif response.status != 200:
+                    result['status'] = 'error'
+                    print(f"Ошибка загрузки курсов: {response.status}")
+                else:
+                    content = await response.read()
+                    validators = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result['status'] = 'error'
+        print(f"Ошибка загрузки курсов: {e!r}")
+
+    if content is not None:
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == _rates_feed['digest']:
+            result['status'] = 'unchanged'
+        else:
+            rates = _parse_cbr_rates(content)
+            current = get_rates()
+            changed = {code: rate for code, rate in rates.items() if current.get(code) != rate}
+            if changed:
+                # Все изменившиеся курсы - одним запросом
+                async with acquire() as conn:
                     await conn.execute('''
                         INSERT INTO currencies (code, rate_to_rub, updated_at)
-                        VALUES ($1, $2, NOW())
+                        SELECT code, rate, NOW()
+                        FROM unnest($1::TEXT[], $2::NUMERIC[]) AS r(code, rate)
                         ON CONFLICT (code) DO UPDATE
                         SET rate_to_rub = EXCLUDED.rate_to_rub,
                             updated_at = NOW()
-                    ''', currency, rate)
-                print("Курсы валют успешно обновлены")
-            finally:
-                await conn.close()
+                    ''', list(changed), list(changed.values()))
+                # Новый снимок курсов подменяется целиком после записи в БД
+                set_rates({**current, **changed})
+            _rates_feed['digest'] = digest
+            result['changed'] = len(changed)
+        # ETag/Last-Modified запоминаются только после записи курсов: если разбор
+        # или запись упали, следующий запрос снова получит ленту, а не 304
+        _rates_feed.update(validators)
+
+    result['duration'] = round(time.perf_counter() - started, 3)
+    print(f"Обновление курсов валют: {result['status']}, изменено {result['changed']}, "
+          f"{result['duration']} с")
+    return result
 
 async def set_user_language(user_id: int, language_code: str):
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         await conn.execute('''
         INSERT INTO user_languages (user_id, language_code)
         VALUES ($1, $2)
@@ -383,33 +341,14 @@ async def set_user_language(user_id: int, language_code: str):
         SET language_code = EXCLUDED.language_code,
             updated_at = NOW()
         ''', user_id, language_code)
-    finally:
-        await conn.close()
+    _profiles.update(user_id, language=language_code)
 
 async def get_user_language(user_id: int) -> str:
-    conn = await get_connection()
-    try:
-        lang = await conn.fetchval(
-            'SELECT language_code FROM user_languages WHERE user_id = $1',
-            user_id
-        )
-        return lang if lang else 'ru'
-    finally:
-        await conn.close()
-
-async def convert_amount(amount: Decimal, from_currency: str, to_currency: str) -> Decimal:
-    if from_currency == to_currency:
-        return amount
-
-    from_rate = await get_currency_rate(from_currency)
-    to_rate = await get_currency_rate(to_currency)
-
-    # Конвертируем через RUB как базовую валюту
-    return (amount / from_rate) * to_rate
+    profile = await get_user_profile(user_id)
+    return profile['language']
 
 async def set_notification_status(user_id: int, enabled: bool):
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         await conn.execute('''
         INSERT INTO user_notifications (user_id, enabled)
         VALUES ($1, $2)
@@ -417,110 +356,94 @@ async def set_notification_status(user_id: int, enabled: bool):
         SET enabled = EXCLUDED.enabled,
             updated_at = NOW()
         ''', user_id, enabled)
-    finally:
-        await conn.close()
+    _profiles.update(user_id, notifications=enabled)
 
 async def get_notification_status(user_id: int) -> bool:
-    conn = await get_connection()
-    try:
-        status = await conn.fetchval(
-            'SELECT enabled FROM user_notifications WHERE user_id = $1',
-            user_id
-        )
-        return status if status is not None else True  # По умолчанию включены
-    finally:
-        await conn.close()
-
-async def cleanup_file(filename: str):
-    """Удаление временного файла"""
-    try:
-        if filename and os.path.exists(filename):
-            os.remove(filename)
-    except Exception as e:
-        print(f"Ошибка при удалении файла: {e}")
-
+    profile = await get_user_profile(user_id)
+    return profile['notifications']
 
 async def add_admin(user_id: int, username: str, is_superadmin: bool = False):
     """Добавление администратора"""
-    conn = await get_connection()
     try:
-        # Проверяем существование пользователя
-        user_exists = await conn.fetchval(
-            'SELECT 1 FROM users WHERE user_id = $1', 
-            user_id
-        )
-        
-        if not user_exists:
-            await add_user(user_id, username, '', '')  # Добавляем базовую информацию
-            
-        await conn.execute('''
-            INSERT INTO admins (user_id, username, is_superadmin)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (user_id) DO UPDATE
-            SET username = EXCLUDED.username,
-                is_superadmin = EXCLUDED.is_superadmin
-        ''', user_id, username, is_superadmin)
+        async with acquire() as conn:
+            # Добавляем базовую информацию о пользователе, если его ещё нет
+            await conn.execute(
+                '''
+                INSERT INTO users
+                (user_id, username, first_name, last_name, registration_date, last_activity_date)
+                VALUES ($1, $2, '', '', NOW(), NOW())
+                ON CONFLICT (user_id) DO NOTHING
+                ''',
+                user_id, username
+            )
+
+            await conn.execute('''
+                INSERT INTO admins (user_id, username, is_superadmin)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (user_id) DO UPDATE
+                SET username = EXCLUDED.username,
+                    is_superadmin = EXCLUDED.is_superadmin
+            ''', user_id, username, is_superadmin)
     except Exception as e:
         print(f"Ошибка при добавлении администратора: {e}")
         raise
     finally:
-        await conn.close()
+        _profiles.invalidate(user_id)
 
 
 async def is_admin(user_id: int) -> bool:
     """Проверка прав администратора"""
-    conn = await get_connection()
-    try:
-        return await conn.fetchval(
-            'SELECT 1 FROM admins WHERE user_id = $1',
-            user_id
-        ) is not None
-    finally:
-        await conn.close()
+    profile = await get_user_profile(user_id)
+    return profile['is_admin']
 
 async def is_superadmin(user_id: int) -> bool:
     """Проверка прав суперадминистратора"""
-    conn = await get_connection()
-    try:
-        return await conn.fetchval(
-            'SELECT is_superadmin FROM admins WHERE user_id = $1',
-            user_id
-        ) or False
-    finally:
-        await conn.close()
+    profile = await get_user_profile(user_id)
+    return profile['is_superadmin']
 
 
-async def get_all_users_stats():
-    """Получение статистики по всем пользователям"""
-    conn = await get_connection()
-    try:
-        # Общая статистика
-        stats = await conn.fetchrow('''
+async def get_all_users_stats(period: Optional[str] = None):
+    """Получение статистики по всем пользователям (за всё время или за период)"""
+    codes, factors = conversion_table('RUB')
+    params = [codes, factors]
+    async with acquire() as conn:
+        if period:
+            # За период считаем по дневным итогам
+            table, condition = 'operations_daily', 'WHERE t.day >= $3'
+            params.append(period_start(period).date())
+        else:
+            # За всё время - по накопительным итогам пользователей
+            table, condition = 'user_category_totals', ''
+
+        # Суммы в разных валютах приводим к рублям по снимку курсов
+        source = f'''(
+            SELECT t.user_id, t.type, t.category, t.total * COALESCE(rate.factor, 1) AS total
+            FROM {table} t
+            LEFT JOIN unnest($1::TEXT[], $2::NUMERIC[]) AS rate(code, factor)
+                ON rate.code = t.currency
+            {condition}
+        ) src'''
+
+        stats = await conn.fetchrow(f'''
             SELECT 
                 COUNT(DISTINCT user_id) as total_users,
-                SUM(CASE WHEN type='income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) as total_expense
-            FROM operations
-        ''')
+                SUM(CASE WHEN type='income' THEN total ELSE 0 END) as total_income,
+                SUM(CASE WHEN type='expense' THEN total ELSE 0 END) as total_expense
+            FROM {source}
+        ''', *params)
 
         # Топ категорий
-        top_income = await conn.fetch('''
-            SELECT category, SUM(amount) as amount 
-            FROM operations 
-            WHERE type = 'income'
-            GROUP BY category 
-            ORDER BY amount DESC 
-            LIMIT 5
-        ''')
-
-        top_expense = await conn.fetch('''
-            SELECT category, SUM(amount) as amount 
-            FROM operations 
-            WHERE type = 'expense'
-            GROUP BY category 
-            ORDER BY amount DESC 
-            LIMIT 5
-        ''')
+        top = await conn.fetch(f'''
+            SELECT type, category, amount
+            FROM (
+                SELECT type, category, SUM(total) as amount,
+                       ROW_NUMBER() OVER (PARTITION BY type ORDER BY SUM(total) DESC) as place
+                FROM {source}
+                GROUP BY type, category
+            ) ranked
+            WHERE place <= 5
+            ORDER BY type, amount DESC
+        ''', *params)
 
         return {
             'total_users': stats['total_users'],
@@ -528,68 +451,86 @@ async def get_all_users_stats():
             'total_expense': float(stats['total_expense']) if stats['total_expense'] else 0.0,
             'top_income_categories': [
                 {'category': row['category'], 'amount': float(row['amount'])}
-                for row in top_income
+                for row in top if row['type'] == 'income'
             ],
             'top_expense_categories': [
                 {'category': row['category'], 'amount': float(row['amount'])}
-                for row in top_expense
+                for row in top if row['type'] == 'expense'
             ]
         }
-    finally:
-        await conn.close()
 
 
-async def export_all_to_excel() -> BytesIO:
-    """Экспорт всех данных в Excel"""
-    conn = await get_connection()
+EXCEL_BATCH_SIZE = 5000  # строк за одно чтение курсора
+EXCEL_MAX_ROWS = 1048576  # лимит строк на листе xlsx
+
+# Листы админской выгрузки: (название, запрос, ширина колонок)
+_EXCEL_SHEETS = (
+    ('Пользователи', 'SELECT * FROM users', ('A:F', 20)),
+    ('Операции', 'SELECT * FROM operations', ('A:H', 15)),
+    ('Администраторы', 'SELECT * FROM admins', ('A:D', 20)),
+)
+
+
+async def _write_sheet(conn, workbook, title: str, query: str, column_width: Tuple[str, int]):
+    """Потоковая запись результата запроса на лист (листы продолжаются при переполнении)"""
+    stmt = await conn.prepare(query)
+    header = [attr.name for attr in stmt.get_attributes()]
+    cursor = await stmt.cursor()
+
+    worksheet = None
+    sheet_number = 0
+    row_index = 0
+    while True:
+        records = await cursor.fetch(EXCEL_BATCH_SIZE)
+        if not records:
+            break
+
+        for record in records:
+            if worksheet is None or row_index >= EXCEL_MAX_ROWS:
+                sheet_number += 1
+                name = title if sheet_number == 1 else f"{title} ({sheet_number})"
+                worksheet = workbook.add_worksheet(name)
+                worksheet.set_column(*column_width)
+                worksheet.write_row(0, 0, header)
+                row_index = 1
+            worksheet.write_row(row_index, 0, tuple(record))
+            row_index += 1
+
+
+async def export_all_to_excel() -> BinaryIO:
+    """
+    Экспорт всех данных в Excel.
+    Строки читаются курсором пачками и сразу пишутся на лист в режиме
+    constant_memory, готовый файл собирается во временном файле
+    (в памяти до MAX_FILE_SIZE, дальше на диске).
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=MAX_FILE_SIZE)
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_numbers': True,
+        'remove_timezone': True,
+        'default_date_format': 'dd.mm.yyyy hh:mm:ss',
+    })
     try:
-        output = BytesIO()
-        
-        # Создаем Excel writer с настройками
-        with pd.ExcelWriter(
-            output,
-            engine='xlsxwriter',
-            engine_kwargs={'options': {'strings_to_numbers': True}}
-        ) as writer:
-            workbook = writer.book
-            
-            # Лист с пользователями
-            users = await conn.fetch("SELECT * FROM users")
-            if users:
-                df_users = pd.DataFrame(users)
-                df_users.to_excel(writer, sheet_name='Пользователи', index=False)
-                worksheet = writer.sheets['Пользователи']
-                worksheet.set_column('A:F', 20)  # Ширина колонок
-
-            # Лист с операциями
-            operations = await conn.fetch("SELECT * FROM operations")
-            if operations:
-                df_ops = pd.DataFrame(operations)
-                df_ops.to_excel(writer, sheet_name='Операции', index=False)
-                worksheet = writer.sheets['Операции']
-                worksheet.set_column('A:G', 15)
-
-            # Лист с администраторами
-            admins = await conn.fetch("SELECT * FROM admins")
-            if admins:
-                df_admins = pd.DataFrame(admins)
-                df_admins.to_excel(writer, sheet_name='Администраторы', index=False)
-                worksheet = writer.sheets['Администраторы']
-                worksheet.set_column('A:D', 20)
-
+        async with acquire() as conn:
+            # Единый снимок данных для всех листов
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                for title, query, column_width in _EXCEL_SHEETS:
+                    await _write_sheet(conn, workbook, title, query, column_width)
+
+        # Сборка xlsx (сжатие) - в отдельном потоке, чтобы не блокировать бота
+        await asyncio.to_thread(workbook.close)
         output.seek(0)
         return output
     except Exception as e:
+        output.close()
         print(f"Ошибка при экспорте в Excel: {e}")
         raise
-    finally:
-        await conn.close()
 
 # Функции для планирования "Цели"
 async def add_goal(user_id: int, name: str, target_amount: Decimal, deadline: datetime = None):
     """Создание новой цели"""
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         await conn.execute(
             '''
             INSERT INTO goals (user_id, name, target_amount, deadline)
@@ -597,64 +538,21 @@ async def add_goal(user_id: int, name: str, target_amount: Decimal, deadline: da
             ''',
             user_id, name, target_amount, deadline
         )
-    finally:
-        await conn.close()
 
 
 async def get_goals(user_id: int) -> List[Dict]:
     """Получить список целей пользователя"""
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         rows = await conn.fetch(
             'SELECT * FROM goals WHERE user_id = $1 AND NOT is_completed ORDER BY created_at DESC',
             user_id
         )
         return [dict(row) for row in rows]
-    finally:
-        await conn.close()
-
-async def update_goal_progress(user_id: int, goal_id: int, amount: Decimal, bot: Bot):
-    conn = await get_connection()
-    try:
-        result = await conn.fetchrow(
-            'SELECT current_amount, target_amount, name FROM goals WHERE id = $1 AND user_id = $2',
-            goal_id, user_id
-        )
-        if not result:
-            return False
-
-        new_amount = result['current_amount'] + amount
-        is_completed = False
-        message_text = ""
-
-        if new_amount >= result['target_amount']:
-            new_amount = result['target_amount']
-            is_completed = True
-            message_text = f"🎉 Поздравляем! Вы достигли цели '{result['name']}'!"
-
-        await conn.execute(
-            '''
-            UPDATE goals SET current_amount = $1, is_completed = $2
-            WHERE id = $3 AND user_id = $4
-            ''',
-            new_amount, is_completed, goal_id, user_id
-        )
-
-        # Отправка уведомления, если цель завершена
-        if is_completed:
-            await bot.send_message(user_id, message_text)
-
-        return True
-    finally:
-        await conn.close()
 
 async def complete_goal(user_id: int, goal_id: int):
     """Завершить цель вручную"""
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         await conn.execute(
             'UPDATE goals SET is_completed = TRUE, current_amount = target_amount WHERE id = $1 AND user_id = $2',
             goal_id, user_id
-        )
-    finally:
-        await conn.close()
\ No newline at end of file
+        )
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Помесячные секции таблицы operations (секционирование по operation_date).
+
+Секции создаются заранее планировщиком. Операции, для месяца которых
+секции ещё нет, попадают в секцию по умолчанию operations_default и
+переносятся в месячную секцию при её создании.
+"""
+import os
+from datetime import date, datetime
+from typing import List
+
+from app.database.pool import acquire
+
+OPERATIONS_DEFAULT_PARTITION = 'operations_default'
+# Ключ advisory-блокировки: секции может создавать планировщик каждого процесса
+PARTITIONS_LOCK_ID = 726354002
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'operations_y{month.year}m{month.month:02d}'
+
+
+async def create_month_partition(conn, month: date) -> bool:
+    """Создаёт секцию на месяц month, если её нет. Возвращает True, если создана"""
+    month = _month_start(month)
+    name = partition_name(month)
+    if await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', name):
+        return False
+
+    await conn.execute('SELECT pg_advisory_lock($1)', PARTITIONS_LOCK_ID)
+    try:
+        # Пока ждали блокировку, секцию мог создать другой процесс. Проверка -
+        # вне транзакции ниже: в уже начатой транзакции кэш каталога может не
+        # увидеть только что созданную таблицу
+        if await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', name):
+            return False
+        await _create_partition_table(conn, month, name)
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', PARTITIONS_LOCK_ID)
+    return True
+
+
+async def _create_partition_table(conn, month: date, name: str):
+    """Создание секции (с переносом строк месяца из секции по умолчанию)"""
+    start, end = month, _next_month(month)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    async with conn.transaction():
+        misplaced = await conn.fetchval(f'''
+            SELECT EXISTS (
+                SELECT 1 FROM {OPERATIONS_DEFAULT_PARTITION}
+                WHERE operation_date >= $1 AND operation_date < $2
+            )
+        ''', start, end)
+        if not misplaced:
+            await conn.execute(f'CREATE TABLE {name} PARTITION OF operations FOR VALUES {bounds}')
+        else:
+            # Строки месяца уже лежат в секции по умолчанию: переносим их
+            # в новую таблицу и только затем подключаем её как секцию
+            await conn.execute(f'CREATE TABLE {name} (LIKE operations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            await conn.execute(f'''
+                WITH moved AS (
+                    DELETE FROM {OPERATIONS_DEFAULT_PARTITION}
+                    WHERE operation_date >= $1 AND operation_date < $2
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            ''', start, end)
+            await conn.execute(f'ALTER TABLE operations ATTACH PARTITION {name} FOR VALUES {bounds}')
+
+
+async def ensure_month_partitions(conn, since: date, months_ahead: int) -> List[str]:
+    """Секции с месяца since по текущий месяц + months_ahead включительно"""
+    created = []
+    month = _month_start(since)
+    last = _month_start(datetime.now().date())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    while month <= last:
+        if await create_month_partition(conn, month):
+            created.append(partition_name(month))
+        month = _next_month(month)
+    return created
+
+
+async def create_upcoming_partitions() -> List[str]:
+    """Задача планировщика: секции на текущий и ближайшие месяцы"""
+    months_ahead = int(os.getenv('OPERATIONS_PARTITIONS_AHEAD', 3))
+    try:
+        async with acquire() as conn:
+            created = await ensure_month_partitions(conn, datetime.now().date(), months_ahead)
+    except Exception as e:
+        print(f"Ошибка создания секций operations: {e}")
+        return []
+    if created:
+        print(f"Созданы секции operations: {', '.join(created)}")
+    return created
@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+import asyncpg
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+_pool: Optional[asyncpg.Pool] = None
+_acquire_timeout = 10.0
+
+# Счётчики для get_pool_stats()
+_stats = {
+    'acquired': 0,
+    'timeouts': 0,
+    'wait_time_total': 0.0,
+    'wait_time_max': 0.0,
+}
+
+
+async def create_pool(**overrides) -> asyncpg.Pool:
+    """Создание общего пула соединений (один раз при запуске процесса)"""
+    global _pool, _acquire_timeout
+    if _pool is not None:
+        return _pool
+
+    # Настройки пула читаются из .env вместе с DB_*
+    _acquire_timeout = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 10))
+    params = dict(
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        database=os.getenv('DB_NAME'),
+        host=os.getenv('DB_HOST'),
+        port=int(os.getenv('DB_PORT', 5432)),
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        command_timeout=float(os.getenv('DB_COMMAND_TIMEOUT', 30)),
+    )
+    params.update(overrides)
+    _pool = await asyncpg.create_pool(**params)
+    return _pool
+
+
+async def close_pool():
+    """Закрытие пула при завершении работы"""
+    global _pool
+    if _pool is None:
+        return
+    pool, _pool = _pool, None
+    await pool.close()
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("Пул соединений не создан: вызовите create_pool() при запуске")
+    return _pool
+
+
+@asynccontextmanager
+async def acquire(timeout: Optional[float] = None) -> AsyncIterator[asyncpg.Connection]:
+    """Получение соединения из пула с ограничением времени ожидания"""
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=timeout or _acquire_timeout)
+    except asyncio.TimeoutError:
+        _stats['timeouts'] += 1
+        raise
+
+    waited = time.perf_counter() - started
+    _stats['acquired'] += 1
+    _stats['wait_time_total'] += waited
+    _stats['wait_time_max'] = max(_stats['wait_time_max'], waited)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Текущее состояние пула и счётчики ожидания соединений"""
+    stats: Dict[str, Any] = dict(_stats)
+    acquired = stats['acquired']
+    stats['wait_time_avg'] = stats['wait_time_total'] / acquired if acquired else 0.0
+    if _pool is not None:
+        size = _pool.get_size()
+        idle = _pool.get_idle_size()
+        stats.update({
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'min_size': _pool.get_min_size(),
+            'max_size': _pool.get_max_size(),
+        })
+    return stats
@@ -0,0 +1,51 @@
+from decimal import Decimal
+from types import MappingProxyType
+from typing import List, Mapping, Tuple
+
+from app.database.pool import acquire
+
+BASE_CURRENCY = 'RUB'
+_ONE = Decimal(1)
+
+# Неизменяемый снимок курсов {код: rate_to_rub}. Обновляется только целиком
+# заменой ссылки, поэтому читатели всегда видят согласованный набор курсов.
+_snapshot: Mapping[str, Decimal] = MappingProxyType({BASE_CURRENCY: _ONE})
+
+
+def set_rates(rates: Mapping[str, Decimal]):
+    """Атомарная замена снимка курсов"""
+    global _snapshot
+    snapshot = {code: Decimal(rate) for code, rate in rates.items() if rate}
+    snapshot.setdefault(BASE_CURRENCY, _ONE)
+    _snapshot = MappingProxyType(snapshot)
+
+
+def get_rates() -> Mapping[str, Decimal]:
+    return _snapshot
+
+
+async def load_rates():
+    """Загрузка курсов из таблицы currencies (при запуске и после обновления)"""
+    async with acquire() as conn:
+        rows = await conn.fetch('SELECT code, rate_to_rub FROM currencies')
+    set_rates({row['code']: row['rate_to_rub'] for row in rows})
+
+
+def conversion_factor(from_currency: str, to_currency: str) -> Decimal:
+    """Множитель для перевода суммы из одной валюты в другую"""
+    if from_currency == to_currency:
+        return _ONE
+    rates = _snapshot
+    # Конвертируем через RUB как базовую валюту
+    return rates.get(to_currency, _ONE) / rates.get(from_currency, _ONE)
+
+
+def conversion_table(to_currency: str) -> Tuple[List[str], List[Decimal]]:
+    """
+    Множители всех известных валют к to_currency. Это и есть пакетная
+    конвертация: таблица передаётся в SQL через unnest и соединяется с
+    операциями (LEFT JOIN ... ON rate.code = currency), так что суммы
+    пересчитываются в самом запросе - по одному множителю на валюту.
+    """
+    codes = list(_snapshot)
+    return codes, [conversion_factor(code, to_currency) for code in codes]
@@ -1,9 +1,10 @@
-import asyncpg
-import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from app.database.models import get_connection
+from app.database import activity
+from app.database.aggregates import aggregate_operations
+from app.database.pool import acquire
+from app.database.models import apply_operation_to_ledger, get_user_currency_settings
 
 load_dotenv()
 
@@ -11,195 +12,89 @@ load_dotenv()
 async def add_operation(user_id: int, op_type: str, amount: float, currency: str,
                         category: str, comment: str) -> bool:
     """Добавление новой операции"""
-    conn = await get_connection()
-    try:
-        now = datetime.now()
-
-        async with conn.transaction():
-            # Добавляем операцию
-            await conn.execute(
-                '''
-                INSERT INTO operations 
-                (user_id, type, amount, category, comment, operation_date)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ''',
-                user_id, op_type, amount, category, comment, now
-            )
-
-            # Обновляем активность пользователя
-            await conn.execute(
-                '''
-                UPDATE users 
-                SET last_activity_date = $1
-                WHERE user_id = $2
-                ''',
-                now, user_id
-            )
-
-            await conn.execute(
-                '''
-                INSERT INTO operations 
-                (user_id, type, amount, currency, category, comment, operation_date)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ''',
-                user_id, op_type, amount, currency, category, comment, datetime.now()
-            )
-
-        return True
-    except Exception as e:
-        print(f"Ошибка при добавлении операции: {e}")
-        return False
-    finally:
-        await conn.close()
+    return await add_operation_to_db(user_id, op_type, amount, category, comment, currency) is not None
 
 
 async def get_balance(user_id: int,
                       period_days: Optional[int] = None) -> Dict[str, float]:
     """Получение баланса пользователя"""
-    conn = await get_connection()
-    try:
-        query = '''
-        SELECT 
-            SUM(CASE WHEN type='income' THEN amount ELSE 0 END) as income,
-            SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) as expense
-        FROM operations
-        WHERE user_id = $1
-        '''
-
-        params = [user_id]
-
-        if period_days:
-            date_from = datetime.now() - timedelta(days=period_days)
-            query += ' AND operation_date >= $2'
-            params.append(date_from)
-
-        result = await conn.fetchrow(query, *params)
-
-        if not result:
-            return {'income': 0.0, 'expense': 0.0, 'balance': 0.0}
-
-        income = result['income'] or 0.0
-        expense = result['expense'] or 0.0
-        return {
-            'income': float(income),
-            'expense': float(expense),
-            'balance': float(income - expense)
-        }
-    finally:
-        await conn.close()
+    date_from = datetime.now() - timedelta(days=period_days) if period_days else None
+    settings = await get_user_currency_settings(user_id)
+    summary = await aggregate_operations(user_id, date_from, currency=settings['currency'])
+    return {
+        'income': summary.income,
+        'expense': summary.expense,
+        'balance': summary.balance
+    }
 
 
 async def get_operations_report(user_id: int,
                                 days: int = 7) -> Dict[str, List[Dict]]:
     """Получение отчета за период"""
-    conn = await get_connection()
-    try:
-        date_from = datetime.now() - timedelta(days=days)
-
-        rows = await conn.fetch('''
-            SELECT type, category, SUM(amount) as total, COUNT(*) as count
-            FROM operations
-            WHERE user_id = $1 AND operation_date >= $2
-            GROUP BY type, category
-            ORDER BY type, SUM(amount) DESC
-            ''', user_id, date_from)
-
-        report = {'income': [], 'expense': []}
-        for row in rows:
-            op_type = row['type']
-            report[op_type].append({
-                'category': row['category'],
-                'total': float(row['total']),
-                'count': row['count']
-            })
-
-        return report
-    finally:
-        await conn.close()
+    date_from = datetime.now() - timedelta(days=days)
+    settings = await get_user_currency_settings(user_id)
+    summary = await aggregate_operations(user_id, date_from, currency=settings['currency'])
+    return {
+        op_type: [
+            {'category': cat.category, 'total': cat.total, 'count': cat.count}
+            for cat in summary.by_type(op_type)
+        ]
+        for op_type in ('income', 'expense')
+    }
 
 # ---- Функции для работы с БД ----
-async def add_operation_to_db(user_id: int, op_type: str, amount: float, category: str, comment: str) -> bool:
-    """Добавление операции в базу данных"""
+async def add_operation_to_db(user_id: int, op_type: str, amount: float, category: str, comment: str,
+                              currency: str = 'RUB') -> Optional[List[Dict]]:
+    """
+    Добавление операции в базу данных (сумма хранится в валюте операции).
+    В той же транзакции продвигает открытые цели пользователя и возвращает
+    список целей, достигнутых этой операцией (None - операция не добавлена).
+    """
     try:
-        conn = await asyncpg.connect(
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            host=os.getenv('DB_HOST'),
-            port=int(os.getenv('DB_PORT', 5432))
-        )
-
-        async with conn.transaction():
-            # Добавляем операцию
-            await conn.execute(
-                '''
-                INSERT INTO operations 
-                (user_id, type, amount, category, comment, operation_date)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ''',
-                user_id, op_type, amount, category, comment, datetime.now()
-            )
-
-            # Обновляем активность пользователя
-            await conn.execute(
-                '''
-                UPDATE users 
-                SET last_activity_date = $1
-                WHERE user_id = $2
-                ''',
-                datetime.now(), user_id
-            )
-
-        return True
+        async with acquire() as conn:
+            now = datetime.now()
+            async with conn.transaction():
+                # Добавляем операцию
+                await conn.execute(
+                    '''
+                    INSERT INTO operations 
+                    (user_id, type, amount, currency, category, comment, operation_date)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
+                    ''',
+                    user_id, op_type, amount, currency, category, comment, now
+                )
+
+                # Обновляем итоги пользователя в той же транзакции
+                await apply_operation_to_ledger(conn, user_id, op_type, amount, category, currency, now)
+
+                # Продвигаем все открытые цели одним запросом, не выше целевой суммы
+                completed = await conn.fetch(
+                    '''
+                    WITH updated AS (
+                        UPDATE goals
+                        SET current_amount = LEAST(COALESCE(current_amount, 0) + $2, target_amount),
+                            is_completed = COALESCE(current_amount, 0) + $2 >= target_amount
+                        WHERE user_id = $1 AND NOT is_completed
+                        RETURNING id, name, is_completed
+                    )
+                    SELECT id, name FROM updated WHERE is_completed
+                    ''',
+                    user_id, amount
+                )
+
+            # Активность пользователя запишется пакетно вне транзакции
+            activity.touch(user_id, now)
+            return [dict(row) for row in completed]
     except Exception as e:
         print(f"Ошибка при добавлении операции: {e}")
-        return False
-    finally:
-        if conn:
-            await conn.close()
-
-
-async def get_operations(user_id: int, period: Optional[str] = None) -> List[Dict]:
-    """Получение операций пользователя из БД"""
-    try:
-        conn = await asyncpg.connect(
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            host=os.getenv('DB_HOST'),
-            port=int(os.getenv('DB_PORT', 5432)))
-
-        query = '''
-        SELECT type, amount, category, comment, operation_date 
-        FROM operations 
-        WHERE user_id = $1
-        '''
-        params = [user_id]
-
-        if period:
-            now = datetime.now()
-            if period == 'day':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'week':
-                start_date = now - timedelta(days=now.weekday())
-                start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'month':
-                start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-            query += ' AND operation_date >= $2'
-            params.append(start_date)
+        return None
 
-        return await conn.fetch(query, *params)
-    finally:
-        if conn:
-            await conn.close()
 
 async def get_goals_for_all_users():
     """
     Возвращает словарь: {user_id: [список целей]}
     """
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT g.*, u.user_id 
@@ -218,5 +113,26 @@ async def get_goals_for_all_users():
                 result[user_id] = []
             result[user_id].append(dict(row))
         return result
-    finally:
-        await conn.close()
\ No newline at end of file
+
+async def complete_reached_goals() -> List[Dict]:
+    """
+    Отмечает выполненными все цели, у которых накоплена целевая сумма, и
+    возвращает те из них, о которых нужно уведомить: с языком владельца,
+    только для пользователей с включёнными уведомлениями. Один запрос.
+    """
+    async with acquire() as conn:
+        rows = await conn.fetch('''
+            WITH completed AS (
+                UPDATE goals
+                SET is_completed = TRUE
+                WHERE NOT is_completed AND current_amount >= target_amount
+                RETURNING id, user_id, name
+            )
+            SELECT c.id, c.user_id, c.name, COALESCE(l.language_code, 'ru') AS language
+            FROM completed c
+            LEFT JOIN user_languages l ON l.user_id = c.user_id
+            LEFT JOIN user_notifications n ON n.user_id = c.user_id
+            WHERE COALESCE(n.enabled, TRUE)
+            ORDER BY c.user_id
+        ''')
+        return [dict(row) for row in rows]
@@ -1,13 +1,15 @@
+from typing import Dict
+
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
     KeyboardButtonPollType
 )
 
-from app.database.locales import get_localized_text
+from app.database.locales import get_localized_text, LANGUAGES, DEFAULT_LANGUAGE
 
 
-def operation_category_keyboard(language_code: str):
+def _build_operation_category(language_code: str):
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text=get_localized_text(language_code, 'add_expense'))],
@@ -17,7 +19,7 @@ def operation_category_keyboard(language_code: str):
         resize_keyboard=True
     )
 
-def settings_keyboard(language_code: str):
+def _build_settings(language_code: str):
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text=get_localized_text(language_code, 'change_currency'))],
@@ -30,7 +32,7 @@ def settings_keyboard(language_code: str):
         one_time_keyboard=True
     )
 
-def currency_keyboard(language: str = 'ru') -> ReplyKeyboardMarkup:
+def _build_currency(language: str) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text=get_localized_text(language, 'currency_rub'))],
@@ -41,7 +43,7 @@ def currency_keyboard(language: str = 'ru') -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
-def language_keyboard(language: str):
+def _build_language(language: str):
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="Русский"), KeyboardButton(text="English")],
@@ -51,7 +53,7 @@ def language_keyboard(language: str):
     )
 
 
-def get_localized_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+def _build_main(language_code: str) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -76,7 +78,7 @@ def get_localized_keyboard(language_code: str) -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
-def report_period_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+def _build_report_period(language_code: str) -> ReplyKeyboardMarkup:
     """Локализованная клавиатура для выбора периода отчета"""
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -88,7 +90,7 @@ def report_period_keyboard(language_code: str) -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
-def pomodoro_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+def _build_pomodoro(language_code: str) -> ReplyKeyboardMarkup:
     """Клавиатура для управления помидоркой"""
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -98,7 +100,7 @@ def pomodoro_keyboard(language_code: str) -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
-def goals_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+def _build_goals(language_code: str) -> ReplyKeyboardMarkup:
     """Клавиатура для работы с целями"""
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -107,4 +109,87 @@ def goals_keyboard(language_code: str) -> ReplyKeyboardMarkup:
             [KeyboardButton(text=get_localized_text(language_code, 'back'))]
         ],
         resize_keyboard=True
-    )
\ No newline at end of file
+    )
+
+
+def _build_notifications(language_code: str, enabled: bool) -> ReplyKeyboardMarkup:
+    """Клавиатура включения/выключения уведомлений"""
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text=get_localized_text(language_code,
+                                                    'notifications_off' if enabled else 'notifications_on'))],
+            [KeyboardButton(text=get_localized_text(language_code, 'back'))]
+        ],
+        resize_keyboard=True
+    )
+
+
+# Клавиатуры зависят только от языка, поэтому собираются один раз при запуске
+# и дальше отдаются из реестра {язык: {имя: клавиатура}}
+_KEYBOARDS: Dict[str, Dict[str, ReplyKeyboardMarkup]] = {}
+
+
+def build_keyboards():
+    """Сборка реестра клавиатур для всех языков каталога"""
+    _KEYBOARDS.clear()
+    for language in LANGUAGES:
+        _KEYBOARDS[language] = {
+            'main': _build_main(language),
+            'operation_category': _build_operation_category(language),
+            'settings': _build_settings(language),
+            'currency': _build_currency(language),
+            'language': _build_language(language),
+            'report_period': _build_report_period(language),
+            'pomodoro': _build_pomodoro(language),
+            'goals': _build_goals(language),
+            'notifications_on': _build_notifications(language, enabled=True),
+            'notifications_off': _build_notifications(language, enabled=False),
+        }
+
+
+def _keyboard(language_code: str, name: str) -> ReplyKeyboardMarkup:
+    keyboards = _KEYBOARDS.get(language_code) or _KEYBOARDS[DEFAULT_LANGUAGE]
+    return keyboards[name]
+
+
+def get_localized_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    return _keyboard(language_code, 'main')
+
+
+def operation_category_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    return _keyboard(language_code, 'operation_category')
+
+
+def settings_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    return _keyboard(language_code, 'settings')
+
+
+def currency_keyboard(language: str = 'ru') -> ReplyKeyboardMarkup:
+    return _keyboard(language, 'currency')
+
+
+def language_keyboard(language: str) -> ReplyKeyboardMarkup:
+    return _keyboard(language, 'language')
+
+
+def report_period_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    """Локализованная клавиатура для выбора периода отчета"""
+    return _keyboard(language_code, 'report_period')
+
+
+def pomodoro_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    """Клавиатура для управления помидоркой"""
+    return _keyboard(language_code, 'pomodoro')
+
+
+def goals_keyboard(language_code: str) -> ReplyKeyboardMarkup:
+    """Клавиатура для работы с целями"""
+    return _keyboard(language_code, 'goals')
+
+
+def notifications_keyboard(language_code: str, enabled: bool) -> ReplyKeyboardMarkup:
+    """Клавиатура уведомлений: предлагает выключить включённые и наоборот"""
+    return _keyboard(language_code, 'notifications_on' if enabled else 'notifications_off')
+
+
+build_keyboards()
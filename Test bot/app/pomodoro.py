@@ -0,0 +1,168 @@
+"""
+Таймеры помидорки: одна задача на процесс вместо задачи на каждого пользователя.
+
+Сессии хранятся в таблице pomodoro_sessions (фаза и время следующего
+переключения), поэтому переживают перезапуск. В памяти - только куча
+(время, user_id) и словарь user_id -> время для отмены. Все сессии,
+время которых наступило, переключаются одним запросом.
+"""
+import os
+import time
+import heapq
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.database.locales import get_localized_text
+from app.database.pool import acquire
+from app.keyboards.kbReply import pomodoro_keyboard
+from app.sender import INTERACTIVE, send_message
+
+WORK_MINUTES = int(os.getenv('POMODORO_WORK_MINUTES', 25))
+BREAK_MINUTES = int(os.getenv('POMODORO_BREAK_MINUTES', 5))
+WORK_SECONDS = WORK_MINUTES * 60
+BREAK_SECONDS = BREAK_MINUTES * 60
+# Пауза перед повторной попыткой загрузить сессии, если БД недоступна при запуске
+RESTORE_RETRY_SECONDS = 5
+
+_heap: List[Tuple[float, int]] = []
+_fire_at: Dict[int, float] = {}  # актуальное время переключения; записи кучи с другим временем устарели
+_wakeup: Optional[asyncio.Event] = None
+_loop_task: Optional[asyncio.Task] = None
+
+
+def _schedule(user_id: int, fire_at: float):
+    _fire_at[user_id] = fire_at
+    heapq.heappush(_heap, (fire_at, user_id))
+    if _wakeup is not None and _heap[0][1] == user_id:
+        _wakeup.set()
+
+
+def is_active(user_id: int) -> bool:
+    return user_id in _fire_at
+
+
+async def start_session(user_id: int, chat_id: int, language: str) -> bool:
+    """Запуск помидорки. False - у пользователя уже идёт сессия"""
+    fire_at = time.time() + WORK_SECONDS
+    async with acquire() as conn:
+        started = await conn.fetchval('''
+            INSERT INTO pomodoro_sessions (user_id, chat_id, language, phase, fire_at)
+            VALUES ($1, $2, $3, 'work', $4)
+            ON CONFLICT (user_id) DO NOTHING
+            RETURNING TRUE
+        ''', user_id, chat_id, language, datetime.fromtimestamp(fire_at, timezone.utc))
+    if not started:
+        return False
+    _schedule(user_id, fire_at)
+    return True
+
+
+async def stop_session(user_id: int) -> bool:
+    """Остановка помидорки. False - сессии не было"""
+    # Запись кучи не удаляется: она будет пропущена как устаревшая
+    _fire_at.pop(user_id, None)
+    async with acquire() as conn:
+        stopped = await conn.fetchval(
+            'DELETE FROM pomodoro_sessions WHERE user_id = $1 RETURNING TRUE',
+            user_id
+        )
+    return bool(stopped)
+
+
+async def _restore(shard: int, shards: int):
+    """Загрузка сессий этого процесса после перезапуска (просроченные сработают сразу)"""
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            'SELECT user_id, fire_at FROM pomodoro_sessions WHERE user_id % $1 = $2',
+            shards, shard
+        )
+    for row in rows:
+        _schedule(row['user_id'], row['fire_at'].timestamp())
+    if rows:
+        print(f"Восстановлено сессий помидорки: {len(rows)}")
+
+
+async def _advance(user_ids: List[int]):
+    """Переключение фазы у всех наступивших сессий и отправка уведомлений"""
+    now = datetime.now(timezone.utc)
+    async with acquire() as conn:
+        rows = await conn.fetch('''
+            UPDATE pomodoro_sessions
+            SET phase = CASE phase WHEN 'work' THEN 'break' ELSE 'work' END,
+                fire_at = $2::TIMESTAMPTZ + make_interval(secs => CASE phase WHEN 'work' THEN $3::FLOAT8 ELSE $4::FLOAT8 END)
+            WHERE user_id = ANY($1::BIGINT[])
+              -- Сессия, перезапущенная во время ожидания соединения, ещё не наступила
+              AND fire_at <= $2
+            RETURNING user_id, chat_id, language, phase, fire_at
+        ''', user_ids, now, float(BREAK_SECONDS), float(WORK_SECONDS))
+
+    for row in rows:
+        if row['user_id'] not in _fire_at:
+            continue  # остановлена, пока шёл запрос
+        _schedule(row['user_id'], row['fire_at'].timestamp())
+        language = row['language']
+        # Началась фаза перерыва - закончилась работа, и наоборот
+        if row['phase'] == 'break':
+            text = get_localized_text(language, 'pomodoro_work_end').format(minutes=BREAK_MINUTES)
+        else:
+            text = get_localized_text(language, 'pomodoro_break_end')
+        await send_message(
+            row['chat_id'],
+            text,
+            priority=INTERACTIVE,
+            reply_markup=pomodoro_keyboard(language)
+        )
+
+
+async def _run(shard: int, shards: int):
+    global _wakeup
+    _wakeup = asyncio.Event()
+    # Без загруженных сессий таймеры этого процесса не сработают: пробуем до успеха
+    while True:
+        try:
+            await _restore(shard, shards)
+            break
+        except Exception as e:
+            print(f"Ошибка загрузки сессий помидорки, повтор через {RESTORE_RETRY_SECONDS} с: {e}")
+            await asyncio.sleep(RESTORE_RETRY_SECONDS)
+    while True:
+        _wakeup.clear()
+        timeout = _heap[0][0] - time.time() if _heap else None
+        if timeout is None or timeout > 0:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        now = time.time()
+        due = []
+        while _heap and _heap[0][0] <= now:
+            fire_at, user_id = heapq.heappop(_heap)
+            if _fire_at.get(user_id) == fire_at:
+                due.append(user_id)
+        if due:
+            try:
+                await _advance(due)
+            except Exception as e:
+                # Сессии остаются в БД; повторим через минуту
+                for user_id in due:
+                    if user_id in _fire_at:
+                        _schedule(user_id, now + 60)
+                print(f"Pomodoro timer error: {e}")
+
+
+def start_pomodoro_service(shard: int = 0, shards: int = 1):
+    """Запуск таймеров помидорки для пользователей с user_id % shards == shard"""
+    global _loop_task
+    if _loop_task is None:
+        _loop_task = asyncio.create_task(_run(shard, shards))
+
+
+async def stop_pomodoro_service():
+    global _loop_task
+    if _loop_task is not None:
+        task, _loop_task = _loop_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -1,32 +1,56 @@
+import os
+from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from app.database.requests import get_goals_for_all_users 
-from app.database.models import get_user_language
-from aiogram import Bot
+from app.database.requests import complete_reached_goals
+from app.database.models import update_currency_rates
+from app.database.partitions import create_upcoming_partitions
+from app.database.rates import load_rates
 from app.database.locales import get_localized_text
+from app.sender import BULK, send_message
 
-async def check_goals(bot):
+
+async def check_goals():
     """Проверяет цели и отправляет уведомления о завершении"""
-    goals_by_user = await get_goals_for_all_users()
-    for user_id, goals in goals_by_user.items():
-        language = await get_user_language(user_id)
-        for goal in goals:
-            percent = min(100, round((goal['current_amount'] / goal['target_amount']) * 100, 1))
-            if percent >= 100 and not goal['is_completed']:
-                message = f"🎉 Поздравляем! Вы достигли цели '{goal['name']}'!"
-                try:
-                    await bot.send_message(user_id, message)
-                except Exception as e:
-                    print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+    goals = await complete_reached_goals()
+    for goal in goals:
+        message = get_localized_text(goal['language'], 'goal_completed').format(goal_name=goal['name'])
+        # Очередь отправки соблюдает лимиты Telegram; при заполненной очереди ждём места
+        await send_message(goal['user_id'], message, priority=BULK, block=True)
+    print(f"Проверка целей: в очередь отправки поставлено уведомлений: {len(goals)}")
+
+
+async def reload_rates():
+    """Перечитывает курсы из БД (их скачивает процесс с общими задачами)"""
+    try:
+        await load_rates()
+    except Exception as e:
+        print(f"Ошибка загрузки курсов валют: {e}")
 
 
-def start_scheduler(bot):
+def start_scheduler(global_jobs: bool = True):
     """
-    Запускает планировщик задач.
+    Запускает планировщик задач. Общие задачи (уведомления о целях, загрузка
+    курсов ЦБ, создание секций) выполняет один процесс; остальные процессы
+    только перечитывают курсы из БД с тем же интервалом.
     """
+    rates_interval = int(os.getenv('CBR_RATES_INTERVAL', 60))
     try:
         scheduler = AsyncIOScheduler()
-        scheduler.add_job(check_goals, 'cron', hour=9, minute=0, args=(bot,))  # Ежедневно в 9:00
+        if global_jobs:
+            scheduler.add_job(check_goals, 'cron', hour=9, minute=0)  # Ежедневно в 9:00
+            # Курсы валют: сразу при запуске и далее по интервалу (неизменившаяся лента не скачивается)
+            scheduler.add_job(
+                update_currency_rates, 'interval',
+                minutes=rates_interval,
+                next_run_time=datetime.now(),
+                max_instances=1, coalesce=True
+            )
+            # Секции operations на ближайшие месяцы создаются заранее
+            scheduler.add_job(create_upcoming_partitions, 'cron', hour=3, minute=0, next_run_time=datetime.now())
+        else:
+            # Курсы загружены при запуске; снимок процесса обновляется из таблицы currencies
+            scheduler.add_job(reload_rates, 'interval', minutes=rates_interval, max_instances=1, coalesce=True)
         scheduler.start()
         print("Планировщик задач запущен.")
     except Exception as e:
-        print(f"Ошибка при запуске планировщика: {e}")
\ No newline at end of file
+        print(f"Ошибка при запуске планировщика: {e}")
@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+                                TelegramRetryAfter, TelegramServerError)
+
+# Очереди (полосы) отправки: интерактивные ответы уходят раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+_LANES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+class TokenBucket:
+    """
+    Ведро токенов с резервированием: reserve() сразу занимает токен и
+    возвращает, сколько секунд нужно подождать до его появления.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self) -> bool:
+        """Ведро полное - запись о чате можно удалить"""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class _Outgoing:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'priority', 'seq', 'attempts', 'chat_reserved')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], priority: int, seq: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq  # порядок постановки, сохраняется при повторах
+        self.attempts = 0
+        self.chat_reserved = False
+
+
+class MessageSender:
+    """
+    Очередь исходящих сообщений бота с ограничением частоты: общий лимит
+    бота и лимит на каждый чат, ожидание по RetryAfter и приоритетные полосы.
+    В каждый чат одновременно отправляется одно сообщение: следующие ждут,
+    пока предыдущее не будет отправлено (с повторами) или отброшено.
+    """
+
+    def __init__(self, bot: Bot,
+                 global_rate: float = 25, global_burst: float = 30,
+                 chat_rate: float = 1, chat_burst: float = 3,
+                 queue_size: int = 10000, concurrency: int = 10, max_retries: int = 3):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[int, TokenBucket] = {}
+        # Чат -> сообщение, которое в него отправляется, и очередь следующих за ним
+        self._active: Dict[int, _Outgoing] = {}
+        self._held: Dict[int, List[tuple]] = {}
+        self._queue: "asyncio.PriorityQueue[tuple]" = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        # Место в полосе занимается при постановке и освобождается после обработки сообщения
+        self._slots = {lane: asyncio.Semaphore(queue_size) for lane in _LANES}
+        self._depth = {lane: 0 for lane in _LANES}
+        self._in_flight = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._pending = 0  # поставлено, но ещё не обработано (включая отложенные)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._paused_until = 0.0
+        self._worker: Optional[asyncio.Task] = None
+        self._started_at = time.monotonic()
+        self._recent = deque()  # время отправки за последнюю минуту
+        self._metrics = {'queued': 0, 'sent': 0, 'failed': 0, 'dropped': 0, 'retried': 0, 'retry_after': 0}
+
+    def start(self):
+        if self._worker is None:
+            self._started_at = time.monotonic()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка: ожидает отправки очереди не дольше timeout секунд"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Отправка остановлена, в очереди осталось {self._pending} сообщений")
+        self._worker.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._worker, *self._tasks, return_exceptions=True)
+        self._worker = None
+
+    async def send(self, chat_id: int, text: str, priority: int = BULK,
+                   block: bool = False, **kwargs) -> bool:
+        """
+        Ставит сообщение в очередь. Если полоса заполнена: при block=True
+        ожидает свободного места (для массовых рассылок), иначе сообщение
+        отбрасывается и возвращается False.
+        """
+        slots = self._slots[priority]
+        if slots.locked() and not block:
+            self._metrics['dropped'] += 1
+            return False
+        await slots.acquire()
+        self._depth[priority] += 1
+        self._pending += 1
+        self._drained.clear()
+        self._metrics['queued'] += 1
+        self._put(_Outgoing(chat_id, text, kwargs, priority, next(self._seq)))
+        return True
+
+    def _put(self, item: _Outgoing):
+        self._queue.put_nowait((item.priority, item.seq, item))
+
+    def _requeue_later(self, item: _Outgoing, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._put, item)
+
+    def _finish(self, item: _Outgoing):
+        self._depth[item.priority] -= 1
+        self._slots[item.priority].release()
+        self._pending -= 1
+        if not self._pending:
+            self._drained.set()
+        # Чат свободен - в очередь возвращается следующее сообщение в него
+        held = self._held.get(item.chat_id)
+        if held:
+            _, _, following = heapq.heappop(held)
+            if not held:
+                del self._held[item.chat_id]
+            self._active[item.chat_id] = following
+            self._put(following)
+        else:
+            del self._active[item.chat_id]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Ведра неактивных чатов полные - их можно забыть
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            _, _, item = await self._queue.get()
+
+            if self._active.setdefault(item.chat_id, item) is not item:
+                # Предыдущее сообщение в этот чат ещё не отправлено или ждёт повтора
+                heapq.heappush(self._held.setdefault(item.chat_id, []), (item.priority, item.seq, item))
+                continue
+
+            if not item.chat_reserved:
+                item.chat_reserved = True
+                delay = self._chat_bucket(item.chat_id).reserve()
+                if delay > 0:
+                    # Чат занят - не задерживаем остальные чаты
+                    self._requeue_later(item, delay)
+                    continue
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            delay = self._global.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._deliver(item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, item: _Outgoing):
+        retry_delay = None
+        try:
+            await self.bot.send_message(item.chat_id, item.text, **item.kwargs)
+            self._metrics['sent'] += 1
+            now = time.monotonic()
+            self._recent.append(now)
+            self._prune_recent(now)
+        except TelegramRetryAfter as e:
+            # Флуд-лимит Telegram: приостанавливаем все отправки
+            self._metrics['retry_after'] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            retry_delay = e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            retry_delay = 2 ** item.attempts
+            print(f"Ошибка отправки в чат {item.chat_id}: {e}")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат недоступен - повтор не поможет
+            self._metrics['failed'] += 1
+            print(f"Не удалось отправить сообщение в чат {item.chat_id}: {e}")
+        except Exception as e:
+            self._metrics['failed'] += 1
+            print(f"Не удалось отправить сообщение в чат {item.chat_id}: {e}")
+        finally:
+            self._in_flight.release()
+
+        if retry_delay is None:
+            self._finish(item)
+        elif item.attempts < self.max_retries:
+            item.attempts += 1
+            self._metrics['retried'] += 1
+            self._requeue_later(item, retry_delay)
+        else:
+            self._metrics['dropped'] += 1
+            self._finish(item)
+
+    def _prune_recent(self, now: float):
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очередей, пропускная способность и счётчики потерь"""
+        now = time.monotonic()
+        self._prune_recent(now)
+        uptime = now - self._started_at
+        stats: Dict[str, Any] = dict(self._metrics)
+        stats.update({
+            f'depth_{name}': self._depth[lane] for lane, name in _LANES.items()
+        })
+        stats['in_flight'] = len(self._tasks)
+        stats['sent_per_minute'] = len(self._recent)
+        stats['throughput'] = stats['sent'] / uptime if uptime else 0.0
+        return stats
+
+
+_sender: Optional[MessageSender] = None
+
+
+def start_sender(bot: Bot, **overrides) -> MessageSender:
+    """Создание и запуск общей очереди отправки (один раз при запуске процесса)"""
+    global _sender
+    if _sender is not None:
+        return _sender
+
+    params = dict(
+        global_rate=float(os.getenv('SENDER_GLOBAL_RATE', 25)),
+        global_burst=float(os.getenv('SENDER_GLOBAL_BURST', 30)),
+        chat_rate=float(os.getenv('SENDER_CHAT_RATE', 1)),
+        chat_burst=float(os.getenv('SENDER_CHAT_BURST', 3)),
+        queue_size=int(os.getenv('SENDER_QUEUE_SIZE', 10000)),
+        concurrency=int(os.getenv('SENDER_CONCURRENCY', 10)),
+        max_retries=int(os.getenv('SENDER_MAX_RETRIES', 3)),
+    )
+    params.update(overrides)
+    _sender = MessageSender(bot, **params)
+    _sender.start()
+    return _sender
+
+
+async def stop_sender():
+    """Остановка очереди отправки при завершении работы"""
+    global _sender
+    if _sender is None:
+        return
+    sender, _sender = _sender, None
+    await sender.stop()
+
+
+def get_sender() -> MessageSender:
+    if _sender is None:
+        raise RuntimeError("Очередь отправки не создана: вызовите start_sender() при запуске")
+    return _sender
+
+
+async def send_message(chat_id: int, text: str, priority: int = BULK,
+                       block: bool = False, **kwargs) -> bool:
+    """Отправка сообщения через общую очередь"""
+    return await get_sender().send(chat_id, text, priority=priority, block=block, **kwargs)
+
+
+def get_sender_stats() -> Dict[str, Any]:
+    return _sender.metrics() if _sender is not None else {}
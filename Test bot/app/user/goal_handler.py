@@ -2,7 +2,7 @@ import datetime
 from app.database.locales import get_localized_text
 from app.database.models import get_user_language 
 from app.database.requests import get_goals_for_all_users
-from aiogram import Bot
+from app.sender import BULK, send_message
 
 async def send_goal_reminders():
     """Отправляет уведомления всем пользователям по их целям"""
@@ -16,12 +16,9 @@ async def send_goal_reminders():
                 f"{get_localized_text(language, 'goal_progress')} '{goal['name']}': {percent}% ({goal['current_amount']} из {goal['target_amount']})"
             )
             if goal['deadline']:
-                days_left = (goal['deadline'] - datetime.now()).days
+                days_left = (goal['deadline'] - datetime.datetime.now()).days
                 if days_left < 0:
                     message += f"\n⚠️ {get_localized_text(language, 'goal_deadline_passed')}"
                 else:
                     message += f"\n📅 {get_localized_text(language, 'goal_days_left').format(days=days_left)}"
-            try:
-                await Bot.send_message(user_id, message)
-            except Exception as e:
-                print(f"Failed to send message to {user_id}: {e}")
\ No newline at end of file
+            await send_message(user_id, message, priority=BULK, block=True)
\ No newline at end of file
@@ -1,24 +1,27 @@
-import os
-import asyncio
-from aiogram import Router, F, Bot
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
+from aiogram import Router, F
+from aiogram.types import Message
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from decimal import Decimal, InvalidOperation
 
-from app.database.locales import get_localized_text
+from app.database.locales import get_localized_text, get_text_key
 from app.database.requests import add_operation_to_db
 from app.keyboards.kbReply import (operation_category_keyboard, get_localized_keyboard, pomodoro_keyboard, goals_keyboard,
-                                   settings_keyboard, currency_keyboard, language_keyboard, report_period_keyboard)
+                                   settings_keyboard, currency_keyboard, language_keyboard, report_period_keyboard,
+                                   notifications_keyboard)
 from app.database.models import (update_user_activity, export_to_csv, get_user_stats,
-                                 MAX_FILE_SIZE, get_user_currency_settings, set_user_language,
+                                 ExportTooLargeError, get_user_currency_settings, set_user_language,
                                  set_user_currency, get_user_language,
-                                  set_notification_status, get_notification_status, add_goal, get_goals, update_goal_progress)
-from aiogram.types import FSInputFile
+                                  set_notification_status, get_notification_status, add_goal, get_goals)
 
-from app.user.quests import calculate_balance, convert_user_operations
+from app.user.menu import TextMenu
+from app.user.quests import calculate_balance
+from app.pomodoro import WORK_MINUTES, start_session, stop_session
+from app.sender import INTERACTIVE, send_message
 
 router = Router()
+# Кнопки меню: один обработчик и поиск по тексту в словаре (app/user/menu.py)
+menu = TextMenu(router)
 
 
 # Состояния для FSM
@@ -51,8 +54,13 @@ class GoalStates(StatesGroup):
     waiting_target = State()
     waiting_deadline = State()
 
+
+# Ключ перевода кнопки -> период отчёта / валюта (текст кнопки - через get_text_key)
+REPORT_PERIODS = {'daily_report': 'day', 'weekly_report': 'week', 'monthly_report': 'month'}
+CURRENCY_BUTTONS = {'currency_rub': 'RUB', 'currency_usd': 'USD', 'currency_eur': 'EUR'}
+
 # ---- Обработчики команд ----
-@router.message((F.text == get_localized_text('ru', 'back')) | (F.text == get_localized_text('en', 'back')))  # Назад
+@menu('back')  # Назад
 async def handle_back_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -64,8 +72,7 @@ async def handle_back_button(message: Message, state: FSMContext):
     await update_user_activity(user_id)
 
 
-@router.message((F.text == get_localized_text('ru', 'add_operation')) | (
-        F.text == get_localized_text('en', 'add_operation')))  # Добавить операцию
+@menu('add_operation')  # Добавить операцию
 async def add_operation(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -129,19 +136,16 @@ async def process_comment(message: Message, state: FSMContext):
     language = await get_user_language(user_id)
     data = await state.get_data()
 
-    await add_operation_to_db(
+    # Прогресс по целям обновляется в той же транзакции, что и добавление операции
+    completed_goals = await add_operation_to_db(
         user_id=user_id,
         op_type=data['category'],
         amount=data['original_amount'],
         category=data['category_name'],
-        comment=message.text
+        comment=message.text,
+        currency=data['currency']
     )
 
-    # Обновляем прогресс по всем целям пользователя
-    goals = await get_goals(user_id)
-    for goal in goals:
-        await update_goal_progress(user_id, goal['id'], Decimal(data['original_amount']), message.bot)
-
     settings = await get_user_currency_settings(user_id)
     current_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(settings['currency'], "₽")
     response = (
@@ -151,10 +155,16 @@ async def process_comment(message: Message, state: FSMContext):
         f"{get_localized_text(language, 'comment')}: {message.text}"
     )
     await message.answer(response, reply_markup=get_localized_keyboard(language))
+    # Уведомления о достигнутых целях - через общую очередь отправки
+    for goal in completed_goals or ():
+        await send_message(
+            message.chat.id,
+            get_localized_text(language, 'goal_completed').format(goal_name=goal['name']),
+            priority=INTERACTIVE
+        )
     await state.clear()
 
-@router.message(
-    (F.text == get_localized_text('ru', 'balance')) | (F.text == get_localized_text('en', 'balance')))  # Баланс
+@menu('balance')  # Баланс
 async def handle_balance(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -182,8 +192,7 @@ async def handle_balance(message: Message):
     await update_user_activity(user_id)
 
 # ---- Отчёты ----
-@router.message(
-    (F.text == get_localized_text('ru', 'report')) | (F.text == get_localized_text('en', 'report')))  # Отчёт
+@menu('report')  # Отчёт
 async def handle_report(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -200,17 +209,11 @@ async def process_report_type(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
 
-    period_map = {
-        get_localized_text(language, 'daily_report'): 'day',
-        get_localized_text(language, 'weekly_report'): 'week',
-        get_localized_text(language, 'monthly_report'): 'month'
-    }
-
-    if message.text not in period_map:
+    period = REPORT_PERIODS.get(get_text_key(message.text))
+    if period is None:
         await message.answer(get_localized_text(language, 'please_select'))
         return
 
-    period = period_map[message.text]
     balance_data = await calculate_balance(user_id, period)
     settings = await get_user_currency_settings(user_id)
     currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(settings['currency'], "₽")
@@ -237,7 +240,7 @@ async def process_report_type(message: Message, state: FSMContext):
     await update_user_activity(user_id)
 
 
-@router.message((F.text == get_localized_text('ru', 'help')) | (F.text == get_localized_text('en', 'help')))  # Справка
+@menu('help')  # Справка
 async def handle_help(message: Message):
     """Обработчик команды 'Справка'"""
     user_id = message.from_user.id
@@ -264,8 +267,7 @@ async def handle_help(message: Message):
     await update_user_activity(user_id)
 
 
-@router.message((F.text == get_localized_text('ru', 'statistics')) | (
-        F.text == get_localized_text('en', 'statistics')))  # Статистика
+@menu('statistics')  # Статистика
 async def handle_stats(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -295,36 +297,29 @@ async def handle_stats(message: Message):
     await update_user_activity(user_id)
 
 
-@router.message(
-    (F.text == get_localized_text('ru', 'export')) | (F.text == get_localized_text('en', 'export')))  # Экспорт
+@menu('export')  # Экспорт
 async def handle_export(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
-    filename = await export_to_csv(user_id)
+    try:
+        document = await export_to_csv(user_id)
+    except ExportTooLargeError:
+        await message.answer(get_localized_text(language, 'file_too_large'))
+        return
 
-    if not filename:
+    if not document:
         await message.answer(get_localized_text(language, 'no_data'))
         return
 
-    try:
-        file_size = os.path.getsize(filename)
-        if file_size > MAX_FILE_SIZE:
-            await message.answer(get_localized_text(language, 'file_too_large'))
-            return
-
-        await message.answer_document(
-            FSInputFile(filename),
-            caption=get_localized_text(language, 'finance_operations')
-        )
-    finally:
-        if os.path.exists(filename):
-            os.remove(filename)
+    await message.answer_document(
+        document,
+        caption=get_localized_text(language, 'finance_operations')
+    )
 
     await update_user_activity(user_id)
 
 
-@router.message(
-    (F.text == get_localized_text('ru', 'settings')) | (F.text == get_localized_text('en', 'settings')))  # Настройки
+@menu('settings')  # Настройки
 async def handle_settings(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -334,8 +329,7 @@ async def handle_settings(message: Message):
     )
 
 
-@router.message((F.text == get_localized_text('ru', 'change_currency')) | (
-        F.text == get_localized_text('en', 'change_currency')))  # Изменить валюту
+@menu('change_currency')  # Изменить валюту
 async def handle_currency(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -350,27 +344,15 @@ async def set_currency(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
 
-    currency_buttons = [
-        get_localized_text(language, 'currency_rub'),
-        get_localized_text(language, 'currency_usd'),
-        get_localized_text(language, 'currency_eur')
-    ]
-
-    if message.text not in currency_buttons:
+    new_currency = CURRENCY_BUTTONS.get(get_text_key(message.text))
+    if new_currency is None:
         await message.answer(get_localized_text(language, 'please_select'))
         return
 
-    currency_map = {
-        get_localized_text(language, 'currency_rub'): "RUB",
-        get_localized_text(language, 'currency_usd'): "USD",
-        get_localized_text(language, 'currency_eur'): "EUR"
-    }
-
-    new_currency = currency_map[message.text]
     settings = await get_user_currency_settings(user_id)
 
     if settings['currency'] != new_currency:
-        await convert_user_operations(user_id, settings['currency'], new_currency)
+        # Суммы хранятся в валюте операций и пересчитываются при показе
         await set_user_currency(user_id, new_currency)
 
         await message.answer(
@@ -386,8 +368,7 @@ async def set_currency(message: Message, state: FSMContext):
     await state.clear()
 
 
-@router.message(
-    (F.text == get_localized_text('ru', 'language')) | (F.text == get_localized_text('en', 'language')))  # Язык
+@menu('language')  # Язык
 async def handle_language(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -418,8 +399,7 @@ async def set_language(message: Message, state: FSMContext):
     await state.clear()
 
 
-@router.message((F.text == get_localized_text('ru', 'notifications')) |  # Уведомления
-                (F.text == get_localized_text('en', 'notifications')))
+@menu('notifications')  # Уведомления
 async def handle_notifications(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -435,14 +415,7 @@ async def handle_notifications(message: Message, state: FSMContext):
         f"{get_localized_text(language, 'notifications_menu')}\n\n"
         f"{get_localized_text(language, 'notifications_current').format(status=status_text)}\n\n"
         f"{action_text}",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text=get_localized_text(language,
-                                                        'notifications_on' if not current_status else 'notifications_off'))],
-                [KeyboardButton(text=get_localized_text(language, 'back'))]
-            ],
-            resize_keyboard=True
-        )
+        reply_markup=notifications_keyboard(language, current_status)
     )
     await state.set_state(NotificationStates.waiting_choice)
 
@@ -471,76 +444,20 @@ async def process_notification_choice(message: Message, state: FSMContext):
 
     await state.clear()
 
-# Добавим словарь для хранения активных таймеров
-active_pomodoros = {}
-
-async def start_pomodoro_timer(user_id: int, chat_id: int, bot: Bot, language: str):
-    """Функция для запуска помидорки (общая логика)"""
-    if user_id in active_pomodoros:
-        return False  # Уже запущено
-
-    active_pomodoros[user_id] = True
-
-    # Отправляем сообщение о начале
-    await bot.send_message(
-        chat_id,
-        get_localized_text(language, 'pomodoro_start'),
-        reply_markup=pomodoro_keyboard(language)
-    )
-
-    # Запускаем таймер
-    asyncio.create_task(pomodoro_timer(user_id, chat_id, bot, language))
-    return True
-
-
-async def pomodoro_timer(user_id: int, chat_id: int, bot: Bot, language: str):
-    """Функция таймера помидорки"""
-    try:
-        while user_id in active_pomodoros:
-            # Рабочее время
-            await asyncio.sleep(25 * 60)
-
-            if user_id not in active_pomodoros:
-                break
-
-            # Перерыв
-            await bot.send_message(
-                chat_id,
-                get_localized_text(language, 'pomodoro_work_end'),
-                reply_markup=pomodoro_keyboard(language)
-            )
-            await asyncio.sleep(5 * 60)
-
-            if user_id not in active_pomodoros:
-                break
-
-            # Конец цикла
-            await bot.send_message(
-                chat_id,
-                get_localized_text(language, 'pomodoro_break_end'),
-                reply_markup=pomodoro_keyboard(language)
-            )
-
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        print(f"Pomodoro timer error: {e}")
-    finally:
-        if user_id in active_pomodoros:
-            del active_pomodoros[user_id]
-
-@router.message((F.text == get_localized_text('ru', 'pomodoro')) | 
-               (F.text == get_localized_text('en', 'pomodoro')))
+@menu('pomodoro')
 async def start_pomodoro(message: Message, state: FSMContext):
     """Запуск помидорки"""
     user_id = message.from_user.id
     language = await get_user_language(user_id)
 
-    success = await start_pomodoro_timer(user_id, message.chat.id, message.bot, language)
-    
-    if not success:
+    # Таймер ведёт общая служба помидорки (app/pomodoro.py)
+    if not await start_session(user_id, message.chat.id, language):
         await message.answer(get_localized_text(language, 'pomodoro_already_running'))
     else:
+        await message.answer(
+            get_localized_text(language, 'pomodoro_start').format(minutes=WORK_MINUTES),
+            reply_markup=pomodoro_keyboard(language)
+        )
         await state.set_state(PomodoroStates.pomodoro_active)
 
 @router.message(F.text.contains("⏹"))
@@ -549,14 +466,10 @@ async def stop_pomodoro(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
     
-    if user_id not in active_pomodoros:
+    if not await stop_session(user_id):
         await message.answer(get_localized_text(language, 'pomodoro_not_running'))
         return
     
-    # Удаляем из активных таймеров
-    if user_id in active_pomodoros:
-        del active_pomodoros[user_id]
-    
     await state.clear()
     await message.answer(
         get_localized_text(language, 'pomodoro_stop'),
@@ -564,8 +477,7 @@ async def stop_pomodoro(message: Message, state: FSMContext):
     )
 
 # Функции для планирования "Цели"
-@router.message((F.text == get_localized_text('ru', 'goals')) | 
-               (F.text == get_localized_text('en', 'goals')))
+@menu('goals')
 async def show_goals_menu(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -574,8 +486,7 @@ async def show_goals_menu(message: Message):
         reply_markup=goals_keyboard(language)
     )
 
-@router.message((F.text == get_localized_text('ru', 'add_goal')) | 
-               (F.text == get_localized_text('en', 'add_goal')))
+@menu('add_goal')
 async def cmd_add_goal(message: Message, state: FSMContext):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -600,7 +511,8 @@ async def process_goal_target(message: Message, state: FSMContext):
         target = Decimal(message.text.replace(',', '.'))
         if target <= 0:
             raise ValueError
-        await state.update_data(target=target)
+        # Данные FSM хранятся в JSON, поэтому сумма - строкой
+        await state.update_data(target=str(target))
         await message.answer(get_localized_text(language, 'goal_optional_deadline'))
         await state.set_state(GoalStates.waiting_deadline)
     except:
@@ -622,12 +534,11 @@ async def process_goal_deadline(message: Message, state: FSMContext):
         except:
             await message.answer(get_localized_text(language, 'invalid_deadline'))
             return
-    await add_goal(user_id, data['name'], data['target'], deadline)
+    await add_goal(user_id, data['name'], Decimal(data['target']), deadline)
     await message.answer(get_localized_text(language, 'goal_created'))
     await state.clear()
 
-@router.message((F.text == get_localized_text('ru', 'view_goals')) | 
-               (F.text == get_localized_text('en', 'view_goals')))
+@menu('view_goals')
 async def cmd_view_goals(message: Message):
     user_id = message.from_user.id
     language = await get_user_language(user_id)
@@ -0,0 +1,94 @@
+"""
+Диспетчер кнопок меню: текст сообщения -> обработчик одним поиском в словаре.
+
+Раньше каждая кнопка была отдельным обработчиком с фильтром
+F.text == <текст на каждом языке>, и aiogram проверял их по очереди.
+Теперь роутер получает один обработчик: ключ кнопки определяется по
+тексту на любом языке через общий индекс каталога переводов
+(locales.resolve_text), а меню хранит только ключ -> обработчик.
+
+Порядок относительно обработчиков состояний FSM сохраняется: кнопка
+срабатывает в состоянии, только если обработчик этого состояния
+зарегистрирован позже неё (как было бы при обычной регистрации).
+"""
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from aiogram import Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+from app.database.locales import resolve_text
+
+MenuHandler = Callable[..., Awaitable[Any]]
+
+
+class TextMenu:
+    def __init__(self, router: Router):
+        self._router = router
+        # ключ перевода -> (позиция среди обработчиков роутера, обработчик, нужен ли state)
+        self._actions: Dict[str, Tuple[int, MenuHandler, bool]] = {}
+        # состояние -> позиция первого обработчика этого состояния
+        self._state_positions: Optional[Dict[str, int]] = None
+        # Регистрируется до остальных обработчиков роутера
+        router.message.register(self._dispatch, self._match)
+
+    def __call__(self, key: str) -> Callable[[MenuHandler], MenuHandler]:
+        """Декоратор: обработчик кнопки с ключом перевода key"""
+        def register(handler: MenuHandler) -> MenuHandler:
+            if key in self._actions:
+                raise ValueError(f"Кнопка '{key}' уже зарегистрирована")
+            position = len(self._router.message.handlers)
+            wants_state = 'state' in inspect.signature(handler).parameters
+            self._actions[key] = (position, handler, wants_state)
+            self._state_positions = None
+            return handler
+        return register
+
+    def _build_state_positions(self) -> Dict[str, int]:
+        # Учитываются обработчики, у которых фильтр - только состояние:
+        # они принимают в этом состоянии любой текст
+        positions: Dict[str, int] = {}
+        for position, handler in enumerate(self._router.message.handlers):
+            if len(handler.filters or ()) != 1:
+                continue
+            for state in _filter_states(handler.filters[0].callback):
+                positions.setdefault(state, position)
+        return positions
+
+    async def _match(self, message: Message, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        resolved = resolve_text(message.text)
+        action = self._actions.get(resolved[1]) if resolved else None
+        if action is None:
+            return False
+        position, handler, wants_state = action
+        if raw_state is not None:
+            if self._state_positions is None:
+                self._state_positions = self._build_state_positions()
+            first = min(self._state_positions.get(raw_state, position),
+                        self._state_positions.get('*', position))
+            if first < position:
+                return False  # состояние обрабатывается раньше кнопки
+        return {'menu_action': (handler, wants_state)}
+
+    @staticmethod
+    async def _dispatch(message: Message, state: FSMContext, menu_action: Tuple[MenuHandler, bool]):
+        handler, wants_state = menu_action
+        if wants_state:
+            await handler(message, state)
+        else:
+            await handler(message)
+
+
+def _filter_states(callback: Any) -> Tuple[str, ...]:
+    if isinstance(callback, State):
+        return (callback.state,)
+    if isinstance(callback, StateFilter):
+        return tuple(
+            state.state if isinstance(state, State) else state
+            for state in callback.states
+            if isinstance(state, (State, str))
+        )
+    return ()
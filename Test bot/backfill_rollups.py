@@ -0,0 +1,32 @@
+"""
+Пересчёт накопительных итогов по категориям (user_category_totals)
+и дневных итогов (operations_daily) по уже существующим операциям.
+
+Запуск: python3 backfill_rollups.py [--user-id ID]
+"""
+import argparse
+import asyncio
+from dotenv import load_dotenv
+
+from app.database.pool import create_pool, close_pool, acquire
+from app.database.models import rebuild_ledger, rebuild_daily_rollup
+
+
+async def main(user_id=None):
+    await create_pool()
+    try:
+        async with acquire() as conn:
+            async with conn.transaction():
+                await rebuild_ledger(conn, user_id)
+                await rebuild_daily_rollup(conn, user_id)
+        print("Итоги пересчитаны" + (f" для пользователя {user_id}" if user_id else ""))
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Пересчёт итогов по операциям")
+    parser.add_argument('--user-id', type=int, default=None, help="пересчитать только одного пользователя")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id))
@@ -0,0 +1,119 @@
+"""
+Задержка обработчиков и число запросов к БД на апдейт.
+
+Апдейты проходят через настоящие роутеры handlerCommand и handlerQuests
+(Dispatcher.feed_update) с ботом без сети и временной базой PostgreSQL
+(см. benchmarks/harness.py). Для каждого размера истории создаётся
+пользователь с таким числом операций, и по нему прогоняются сценарии.
+
+Состояния FSM записываются в БД пачками в фоне, поэтому в замер не входят:
+буфер сбрасывается после каждого сценария.
+
+Запуск (из каталога "Test bot"):
+    python -m benchmarks.handlers_bench [--sizes 10,10000,1000000] [--iterations 200]
+"""
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from benchmarks.harness import (bench_database, count_queries, create_bench_bot, create_bench_dispatcher,
+                                message_update, percentiles, seed_user)
+from app.database.locales import get_localized_text
+
+LANGUAGE = 'ru'
+DEFAULT_SIZES = (10, 10_000, 1_000_000)
+
+
+def _button(key: str) -> str:
+    return get_localized_text(LANGUAGE, key)
+
+
+# Сценарий: (название, [(шаг, текст сообщения), ...])
+FLOWS: List[Tuple[str, List[Tuple[str, str]]]] = [
+    ('/start', [('/start', '/start')]),
+    ('Баланс', [('баланс', _button('balance'))]),
+    ('Отчёт за день', [('меню отчёта', _button('report')), ('день', _button('daily_report'))]),
+    ('Отчёт за неделю', [('меню отчёта', _button('report')), ('неделя', _button('weekly_report'))]),
+    ('Отчёт за месяц', [('меню отчёта', _button('report')), ('месяц', _button('monthly_report'))]),
+    ('Добавление операции', [
+        ('меню операции', _button('add_operation')),
+        ('категория', _button('add_expense')),
+        ('сумма', '150'),
+        ('комментарий', 'benchmark'),
+    ]),
+    ('Экспорт', [('экспорт', _button('export'))]),
+    ('Смена валюты', [
+        ('меню валюты', _button('change_currency')),
+        ('USD', _button('currency_usd')),
+        ('меню валюты', _button('change_currency')),
+        ('RUB', _button('currency_rub')),
+    ]),
+]
+
+
+async def run_flows(dp, bot, user_id: int, iterations: int, warmup: int) -> Dict[Tuple[str, str], Dict[str, list]]:
+    """Прогон всех сценариев; по каждому шагу - задержки, запросы к БД и вызовы API"""
+    results: Dict[Tuple[str, str], Dict[str, list]] = {}
+    session = bot.session
+    for iteration in range(warmup + iterations):
+        for flow, steps in FLOWS:
+            for step, text in steps:
+                update = message_update(user_id, text, LANGUAGE)
+                counter = count_queries()
+                calls_before = session.total_calls()
+
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                elapsed = time.perf_counter() - started
+                await asyncio.sleep(0)  # логгер запросов вызывается через call_soon
+
+                if iteration < warmup:
+                    continue
+                sample = results.setdefault((flow, step), {'latency': [], 'queries': [], 'calls': []})
+                sample['latency'].append(elapsed)
+                sample['queries'].append(counter.queries)
+                sample['calls'].append(session.total_calls() - calls_before)
+            await dp.storage.flush()
+    return results
+
+
+def print_report(size: int, results: Dict[Tuple[str, str], Dict[str, list]]):
+    print(f"\nОпераций у пользователя: {size:,}".replace(',', ' '))
+    print(f"{'сценарий / шаг':<38} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'запросов':>9} {'API':>5}")
+    for (flow, step), sample in results.items():
+        p = percentiles(sample['latency'])
+        queries = sum(sample['queries']) / len(sample['queries'])
+        calls = sum(sample['calls']) / len(sample['calls'])
+        print(f"{flow + ' / ' + step:<38} {p['p50'] * 1000:>9.2f} {p['p95'] * 1000:>9.2f} "
+              f"{p['p99'] * 1000:>9.2f} {queries:>9.1f} {calls:>5.1f}")
+
+
+async def main(sizes: List[int], iterations: int, warmup: int, keep_db: bool):
+    async with bench_database(keep=keep_db):
+        dp = create_bench_dispatcher()
+        bot = create_bench_bot()
+        try:
+            for index, size in enumerate(sizes):
+                user_id = 1_000_000 + index
+                started = time.perf_counter()
+                await seed_user(user_id, size, LANGUAGE)
+                print(f"Заполнено {size} операций за {time.perf_counter() - started:.1f} с")
+                print_report(size, await run_flows(dp, bot, user_id, iterations, warmup))
+        finally:
+            await dp.storage.close()
+            await bot.session.close()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Задержка обработчиков бота по сценариям")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="размеры истории операций через запятую")
+    parser.add_argument('--iterations', type=int, default=200, help="замеров на шаг сценария")
+    parser.add_argument('--warmup', type=int, default=5, help="прогонов без замера (прогрев кэшей)")
+    parser.add_argument('--keep-db', action='store_true', help="не удалять временную базу")
+    args = parser.parse_args()
+    asyncio.run(main([int(size) for size in args.sizes.split(',')], args.iterations, args.warmup, args.keep_db))
@@ -0,0 +1,221 @@
+"""
+Общие части бенчмарков обработчиков: бот без сети, временная база
+PostgreSQL с подсчётом запросов, заполнение операциями и перцентили.
+
+База создаётся на сервере из настроек DB_* (.env) под именем
+BENCH_DB_NAME (по умолчанию bench_<pid>) и удаляется после прогона.
+"""
+import os
+import time
+import asyncio
+import itertools
+import statistics
+import contextvars
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import asyncpg
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, Update
+
+from app.database.fsm_storage import PostgresStorage
+from app.database.locales import get_localized_text
+from app.database.migrations import init_db
+from app.database.models import add_user, rebuild_daily_rollup, rebuild_ledger, set_user_language
+from app.database.partitions import ensure_month_partitions
+from app.database.pool import acquire, close_pool, create_pool
+from app.database.rates import load_rates
+
+BOT_ID = 42
+BENCH_TOKEN = f'{BOT_ID}:BENCHMARK'
+SEED_HISTORY_DAYS = 3 * 365
+
+
+# ---- Подсчёт запросов к БД ----
+
+class QueryCounter:
+    __slots__ = ('queries',)
+
+    def __init__(self):
+        self.queries = 0
+
+
+# Счётчик текущей задачи; логгер asyncpg вызывается через call_soon
+# и получает контекст задачи, выполнившей запрос
+_current_counter: contextvars.ContextVar[Optional[QueryCounter]] = contextvars.ContextVar(
+    'bench_query_counter', default=None
+)
+
+
+def _count_query(record):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.queries += 1
+
+
+async def _attach_query_logger(conn: asyncpg.Connection):
+    # COPY (экспорт) логгер asyncpg не видит, остальные запросы - все, включая BEGIN/COMMIT
+    conn.add_query_logger(_count_query)
+
+
+def count_queries() -> QueryCounter:
+    """Новый счётчик для запросов, выполняемых дальше в текущей задаче"""
+    counter = QueryCounter()
+    _current_counter.set(counter)
+    return counter
+
+
+# ---- Бот без сети ----
+
+class RecordingSession(BaseSession):
+    """
+    Сессия, которая не ходит в Telegram: запоминает вызовы API и отвечает
+    подходящим объектом. latency - имитация задержки ответа Telegram.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.__returning__ is Message:
+            chat_id = getattr(method, 'chat_id', 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type='private'),
+            )
+        return True
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncIterator[bytes]:
+        return
+        yield b''
+
+    async def close(self):
+        pass
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+def create_bench_bot(latency: float = 0.0) -> Bot:
+    return Bot(BENCH_TOKEN, session=RecordingSession(latency), default=DefaultBotProperties(parse_mode='HTML'))
+
+
+def create_bench_dispatcher() -> Dispatcher:
+    """Диспетчер с пользовательскими роутерами бота (как в run.create_dispatcher, без админки)"""
+    from app.user import handlerCommand, handlerQuests
+
+    dp = Dispatcher(storage=PostgresStorage.from_env())
+    dp.include_routers(handlerCommand.router, handlerQuests.router)
+    return dp
+
+
+_update_ids = itertools.count(1)
+
+
+def message_update(user_id: int, text: str, language: str = 'ru') -> Update:
+    """Апдейт с текстовым сообщением пользователя в личном чате"""
+    update_id = next(_update_ids)
+    return Update.model_validate({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'bench{user_id}', 'language_code': language},
+            'text': text,
+        },
+    })
+
+
+# ---- Временная база ----
+
+@asynccontextmanager
+async def bench_database(keep: bool = False, **pool_overrides) -> AsyncIterator[str]:
+    """Создаёт пустую базу, применяет миграции и открывает на неё общий пул"""
+    name = os.getenv('BENCH_DB_NAME', f'bench_{os.getpid()}')
+    admin_params = dict(
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        port=int(os.getenv('DB_PORT', 5432)),
+        database=os.getenv('BENCH_MAINTENANCE_DB', 'postgres'),
+    )
+    admin = await asyncpg.connect(**admin_params)
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        await admin.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await admin.close()
+
+    try:
+        await create_pool(database=name, init=_attach_query_logger, **pool_overrides)
+        await init_db()
+        await load_rates()
+        yield name
+    finally:
+        await close_pool()
+        if not keep:
+            admin = await asyncpg.connect(**admin_params)
+            try:
+                await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+            finally:
+                await admin.close()
+
+
+async def seed_users(user_ids: Sequence[int], operations: int, language: str = 'ru'):
+    """Пользователи с operations операциями у каждого за последние SEED_HISTORY_DAYS дней"""
+    for user_id in user_ids:
+        await add_user(user_id, f'bench{user_id}', f'bench{user_id}', None)
+        await set_user_language(user_id, language)
+    since = (datetime.now() - timedelta(days=SEED_HISTORY_DAYS)).date()
+    async with acquire() as conn:
+        await ensure_month_partitions(conn, since, int(os.getenv('OPERATIONS_PARTITIONS_AHEAD', 3)))
+        # Категории в боте - тексты кнопок "Доход"/"Расход"
+        await conn.execute('''
+            INSERT INTO operations (user_id, type, amount, category, comment, operation_date, currency)
+            SELECT u.user_id,
+                   CASE WHEN i % 4 = 0 THEN 'income' ELSE 'expense' END,
+                   ROUND((random() * 5000 + 1)::NUMERIC, 2),
+                   CASE WHEN i % 4 = 0 THEN $3 ELSE $4 END,
+                   'seed ' || i,
+                   LOCALTIMESTAMP - make_interval(secs => random() * $5),
+                   (ARRAY['RUB', 'RUB', 'RUB', 'USD', 'EUR'])[1 + i % 5]
+            FROM unnest($1::BIGINT[]) AS u(user_id)
+            CROSS JOIN generate_series(1, $2) AS i
+        ''', list(user_ids), operations, get_localized_text(language, 'add_income'),
+            get_localized_text(language, 'add_expense'), float(SEED_HISTORY_DAYS * 86400))
+        # Итоги пересчитываются по всей таблице, если пользователей несколько
+        only_user = user_ids[0] if len(user_ids) == 1 else None
+        async with conn.transaction():
+            await rebuild_ledger(conn, only_user)
+            await rebuild_daily_rollup(conn, only_user)
+        await conn.execute('ANALYZE operations')
+
+
+async def seed_user(user_id: int, operations: int, language: str = 'ru'):
+    await seed_users([user_id], operations, language)
+
+
+# ---- Статистика ----
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 (в единицах samples)"""
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    if len(samples) == 1:
+        return {'p50': samples[0], 'p95': samples[0], 'p99': samples[0]}
+    cuts: List[float] = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
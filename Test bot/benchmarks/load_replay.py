@@ -0,0 +1,219 @@
+"""
+Нагрузочный прогон одного процесса бота синтетическими потоками апдейтов.
+
+Тысячи имитируемых пользователей одновременно ходят по меню, добавляют
+операции (три шага FSM), смотрят отчёты и создают цели. Апдейты идут в
+диспетчер из run.create_dispatcher(with_admin=False) с запущенными
+фоновыми службами (run.start_services без общих задач планировщика);
+апдейты одного пользователя обрабатываются по порядку, как при webhook. Telegram заменён ботом без
+сети с задержкой ответа --api-latency, база - временная (benchmarks/harness.py).
+
+Отчёт: устойчивая пропускная способность (апдейтов/с), задержка апдейта,
+лаг цикла событий и загрузка пула соединений с БД.
+
+Запуск (из каталога "Test bot"):
+    python -m benchmarks.load_replay [--users 2000] [--duration 60] [--think 0.5]
+"""
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from typing import Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from benchmarks.harness import bench_database, create_bench_bot, message_update, percentiles, seed_users
+from app.database.locales import get_localized_text
+from app.database.pool import get_pool_stats
+
+FIRST_USER_ID = 2_000_000
+COMMENTS = ('обед', 'такси', 'продукты', 'кино', 'аптека', 'подарок', 'зарплата', 'кофе')
+GOAL_NAMES = ('Отпуск', 'Ноутбук', 'Подушка безопасности', 'Велосипед', 'Ремонт')
+
+
+# ---- Сценарии пользователя: список текстов сообщений ----
+
+def _menu_taps(rng: random.Random, language: str) -> List[str]:
+    keys = ('balance', 'statistics', 'help', 'settings', 'back', 'goals', 'view_goals')
+    return [get_localized_text(language, key) for key in rng.sample(keys, rng.randint(1, 3))]
+
+
+def _add_operation(rng: random.Random, language: str) -> List[str]:
+    return [
+        get_localized_text(language, 'add_operation'),
+        get_localized_text(language, rng.choice(('add_expense', 'add_expense', 'add_income'))),
+        f'{rng.uniform(1, 5000):.2f}',
+        rng.choice(COMMENTS),
+    ]
+
+
+def _report(rng: random.Random, language: str) -> List[str]:
+    return [
+        get_localized_text(language, 'report'),
+        get_localized_text(language, rng.choice(('daily_report', 'weekly_report', 'monthly_report'))),
+    ]
+
+
+def _create_goal(rng: random.Random, language: str) -> List[str]:
+    return [
+        get_localized_text(language, 'goals'),
+        get_localized_text(language, 'add_goal'),
+        rng.choice(GOAL_NAMES),
+        str(rng.randint(10, 500) * 1000),
+        'нет',  # срок не указывается (обработчик понимает только "нет")
+    ]
+
+
+# (сценарий, вес)
+SCENARIOS: Tuple[Tuple[Callable[[random.Random, str], List[str]], int], ...] = (
+    (_menu_taps, 40),
+    (_add_operation, 35),
+    (_report, 15),
+    (_create_goal, 10),
+)
+
+
+# ---- Прогон ----
+
+class LoadStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self.per_second: Dict[int, int] = {}
+        self.loop_lag: List[float] = []
+        self.pool_in_use: List[int] = []
+        self.pool_max_size = 0
+
+    def record(self, latency: float, failed: bool):
+        self.completed += 1
+        self.errors += failed
+        self.latencies.append(latency)
+        second = int(time.monotonic() - self.started)
+        self.per_second[second] = self.per_second.get(second, 0) + 1
+
+
+async def _feed(dp, bot, stats: LoadStats, user_id: int, text: str, language: str):
+    update = message_update(user_id, text, language)
+    started = time.perf_counter()
+    failed = False
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        failed = True
+        if stats.errors < 10:
+            print(f"Ошибка обработки апдейта пользователя {user_id}: {type(e).__name__}: {e}")
+    stats.record(time.perf_counter() - started, failed)
+
+
+async def simulate_user(dp, bot, stats: LoadStats, user_id: int, language: str, rng: random.Random,
+                        ramp: float, think: float, deadline: float):
+    """Один пользователь: /start, затем случайные сценарии до deadline"""
+    await asyncio.sleep(rng.uniform(0, ramp))
+    await _feed(dp, bot, stats, user_id, '/start', language)
+    scenarios, weights = zip(*SCENARIOS)
+    while True:
+        for text in rng.choices(scenarios, weights)[0](rng, language):
+            if think:
+                # Пауза не выходит за конец прогона, иначе он затянется без нагрузки
+                await asyncio.sleep(min(rng.expovariate(1 / think), max(0.0, deadline - time.monotonic())))
+            if time.monotonic() >= deadline:
+                return
+            await _feed(dp, bot, stats, user_id, text, language)
+
+
+async def monitor(stats: LoadStats, interval: float, stop: asyncio.Event):
+    """Замер лага цикла событий и занятости пула раз в interval секунд"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, time.perf_counter() - expected))
+        pool = get_pool_stats()
+        stats.pool_in_use.append(pool.get('in_use', 0))
+        stats.pool_max_size = pool.get('max_size', 0)
+
+
+def print_report(stats: LoadStats, elapsed: float, ramp: float, users: int, pool_before: Dict, pool_after: Dict,
+                 api_calls: int):
+    # Устойчивая пропускная способность - медиана по секундам после разгона, без последней неполной секунды
+    seconds = [count for second, count in sorted(stats.per_second.items())
+               if ramp <= second < int(elapsed)]
+    sustained = statistics.median(seconds) if seconds else stats.completed / elapsed
+    latency = percentiles(stats.latencies)
+    lag = percentiles(stats.loop_lag)
+
+    acquired = pool_after['acquired'] - pool_before['acquired']
+    wait_total = pool_after['wait_time_total'] - pool_before['wait_time_total']
+    in_use = stats.pool_in_use or [0]
+    full = sum(1 for value in in_use if stats.pool_max_size and value >= stats.pool_max_size)
+
+    print(f"\nПользователей: {users}, длительность: {elapsed:.1f} с")
+    print(f"Апдейтов: {stats.completed}, ошибок: {stats.errors}, вызовов API: {api_calls}")
+    print(f"Пропускная способность: {sustained:.0f} апдейтов/с устойчиво, "
+          f"{stats.completed / elapsed:.0f} апдейтов/с в среднем")
+    print(f"Задержка апдейта, мс: p50 {latency['p50'] * 1000:.2f}, p95 {latency['p95'] * 1000:.2f}, "
+          f"p99 {latency['p99'] * 1000:.2f}")
+    print(f"Лаг цикла событий, мс: p50 {lag['p50'] * 1000:.2f}, p95 {lag['p95'] * 1000:.2f}, "
+          f"p99 {lag['p99'] * 1000:.2f}, макс {max(stats.loop_lag or [0]) * 1000:.2f}")
+    print(f"Пул БД: занято в среднем {sum(in_use) / len(in_use):.1f} из {stats.pool_max_size}, "
+          f"полностью занят {full / len(in_use):.0%} замеров")
+    print(f"Ожидание соединения, мс: среднее {wait_total / acquired * 1000 if acquired else 0:.2f}, "
+          f"макс {pool_after['wait_time_max'] * 1000:.2f}; "
+          f"таймаутов: {pool_after['timeouts'] - pool_before['timeouts']}")
+
+
+async def main(args):
+    # run.py читает настройки из окружения (load_dotenv) при импорте
+    import run
+
+    rng = random.Random(args.seed)
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    languages = {user_id: 'en' if rng.random() < args.en_share else 'ru' for user_id in user_ids}
+
+    async with bench_database(keep=args.keep_db):
+        for language in ('ru', 'en'):
+            group = [user_id for user_id in user_ids if languages[user_id] == language]
+            if group:
+                await seed_users(group, args.operations, language)
+        print(f"Заполнено: {args.users} пользователей по {args.operations} операций")
+
+        bot = create_bench_bot(args.api_latency)
+        dp = run.create_dispatcher(with_admin=False)
+        run.start_services(bot, global_jobs=False)
+        try:
+            stats = LoadStats()
+            stop = asyncio.Event()
+            monitor_task = asyncio.create_task(monitor(stats, args.sample_interval, stop))
+            pool_before = get_pool_stats()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*(
+                simulate_user(dp, bot, stats, user_id, languages[user_id], random.Random(rng.random()),
+                              args.ramp, args.think, deadline)
+                for user_id in user_ids
+            ))
+            elapsed = time.monotonic() - stats.started
+            stop.set()
+            await monitor_task
+            print_report(stats, elapsed, args.ramp, args.users, pool_before, get_pool_stats(),
+                         bot.session.total_calls())
+        finally:
+            await run.shutdown(dp, bot)
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота синтетическими апдейтами")
+    parser.add_argument('--users', type=int, default=2000, help="число имитируемых пользователей")
+    parser.add_argument('--duration', type=float, default=60, help="длительность прогона, с")
+    parser.add_argument('--ramp', type=float, default=5, help="пользователи подключаются равномерно за это время, с")
+    parser.add_argument('--think', type=float, default=0.5,
+                        help="средняя пауза пользователя между сообщениями, с (0 - без пауз)")
+    parser.add_argument('--operations', type=int, default=100, help="операций в истории каждого пользователя")
+    parser.add_argument('--en-share', type=float, default=0.2, help="доля пользователей с английским языком")
+    parser.add_argument('--api-latency', type=float, default=0.05, help="имитируемая задержка ответа Telegram, с")
+    parser.add_argument('--sample-interval', type=float, default=0.05, help="период замеров лага и пула, с")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора сценариев")
+    parser.add_argument('--keep-db', action='store_true', help="не удалять временную базу")
+    asyncio.run(main(parser.parse_args()))
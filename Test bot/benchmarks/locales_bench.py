@@ -0,0 +1,45 @@
+"""
+Микробенчмарк get_localized_text: стоимость одного вызова до и после
+сборки каталога при импорте.
+
+Запуск (из каталога "Test bot"): python -m benchmarks.locales_bench
+"""
+import timeit
+
+from app.database.locales import TRANSLATIONS, get_localized_text, resolve_text
+
+CALLS = 200_000
+
+
+def legacy_get_localized_text(language_code: str, text_key: str) -> str:
+    # Старое поведение: весь словарь переводов создавался заново при каждом вызове
+    translations = {language: dict(texts) for language, texts in TRANSLATIONS.items()}
+    return translations.get(language_code, translations['ru']).get(text_key, text_key)
+
+
+def legacy_resolve_text(text: str):
+    # Старый способ узнать ключ по тексту кнопки: перебор языков и ключей
+    for language in TRANSLATIONS:
+        for key in TRANSLATIONS[language]:
+            if legacy_get_localized_text(language, key) == text:
+                return language, key
+    return None
+
+
+def per_call_ns(func, *args, number: int = CALLS) -> float:
+    return timeit.timeit(lambda: func(*args), number=number) / number * 1e9
+
+
+def main():
+    rows = [
+        ('get_localized_text (до)', per_call_ns(legacy_get_localized_text, 'en', 'balance')),
+        ('get_localized_text (после)', per_call_ns(get_localized_text, 'en', 'balance')),
+        ('текст -> ключ (до)', per_call_ns(legacy_resolve_text, '🔙 BACK', number=200)),
+        ('текст -> ключ (после)', per_call_ns(resolve_text, '🔙 BACK')),
+    ]
+    for name, ns in rows:
+        print(f"{name:<28} {ns:>14,.0f} нс/вызов")
+
+
+if __name__ == '__main__':
+    main()
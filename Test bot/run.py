@@ -2,44 +2,95 @@ import os
 import asyncio
 from aiogram import Bot, Dispatcher
 from app.scheduler import start_scheduler
-from app.admin.handlers import router as admin_router
 from app.user import handlerCommand, handlerQuests
 from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
-from app.database.models import init_db, add_admin
+from app.database.models import add_admin
+from app.database.migrations import init_db
+from app.database.pool import create_pool, close_pool
+from app.database.activity import start_activity_flusher, stop_activity_flusher
+from app.database.fsm_storage import PostgresStorage
+from app.database.rates import load_rates
+from app.sender import start_sender, stop_sender
+from app.pomodoro import start_pomodoro_service, stop_pomodoro_service
 
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-SUPERADMIN_ID = int(os.getenv("SUPERADMIN_ID"))
 
-async def shutdown(dispatcher: Dispatcher, bot: Bot):
-    """Обработка завершения работы"""
-    await dispatcher.storage.close()
-    await bot.session.close()
+def create_bot() -> Bot:
+    return Bot(BOT_TOKEN,
+               default=DefaultBotProperties(parse_mode='HTML')
+               )
 
-async def main():
-    # Инициализация базы данных перед запуском бота
+
+def create_dispatcher(with_admin: bool = True) -> Dispatcher:
+    """
+    Диспетчер с роутерами бота (общий для polling и webhook-обработчиков).
+    with_admin=False - без админки (нагрузочные прогоны)
+    """
+    # Состояния диалогов хранятся в PostgreSQL и переживают перезапуск
+    dp = Dispatcher(storage=PostgresStorage.from_env())
+    dp.include_routers(
+        handlerCommand.router,
+        handlerQuests.router
+    )
+    if with_admin:
+        from app.admin.handlers import router as admin_router
+        dp.include_router(admin_router)
+    return dp
+
+
+async def init_database() -> bool:
+    """Инициализация базы данных перед запуском бота"""
     try:
+        await create_pool()
         await init_db()
+        # Снимок курсов валют в памяти процесса
+        await load_rates()
 
         # Добавляем первого администратора (ваш ID)
-        await add_admin(SUPERADMIN_ID, "admin", is_superadmin=True)
+        await add_admin(int(os.getenv("SUPERADMIN_ID")), "admin", is_superadmin=True)
+        return True
     except Exception as e:
         print(f"Ошибка инициализации БД: {e}")
+        await close_pool()
+        return False
+
+
+def start_services(bot: Bot, global_jobs: bool = True, shard: int = 0, shards: int = 1,
+                   **sender_overrides):
+    """
+    Фоновые службы процесса: очередь отправки, запись активности, таймеры
+    помидорки (для пользователей с user_id % shards == shard), планировщик.
+    Общие задачи планировщика (global_jobs) запускаются только в одном процессе
+    """
+    start_sender(bot, **sender_overrides)
+    start_activity_flusher()
+    start_pomodoro_service(shard, shards)
+    start_scheduler(global_jobs)
+
+
+async def shutdown(dispatcher: Dispatcher, bot: Bot):
+    """Обработка завершения работы"""
+    # Сессии помидорки хранятся в БД и продолжатся после перезапуска
+    await stop_pomodoro_service()
+    # Дожидаемся отправки поставленных в очередь сообщений
+    await stop_sender()
+    await dispatcher.storage.close()
+    await bot.session.close()
+    # Последняя запись накопленной активности пользователей
+    await stop_activity_flusher()
+    await close_pool()
+
+async def main():
+    if not await init_database():
         return
 
-    bot = Bot(BOT_TOKEN,
-              default=DefaultBotProperties(parse_mode='HTML')
-              )
-    dp = Dispatcher()
-    dp.include_routers(
-        handlerCommand.router,
-        handlerQuests.router,
-        admin_router
-    )
-    start_scheduler(bot)
+    bot = create_bot()
+    dp = create_dispatcher()
+    start_services(bot)
     await bot.delete_webhook(drop_pending_updates=True)
     try:
         await dp.start_polling(bot)
@@ -0,0 +1,173 @@
+"""
+Запуск бота через webhook с обработкой апдейтов в нескольких процессах.
+
+Основной процесс принимает апдейты от Telegram (aiohttp) и раскладывает их
+по процессам-обработчикам по user_id: апдейты одного пользователя всегда
+попадают в один процесс и обрабатываются в нём по порядку, поэтому
+состояние помидорки и порядок сообщений пользователя сохраняются.
+Общие задачи планировщика выполняет обработчик 0, остальные только
+перечитывают курсы валют из БД.
+
+Запуск: python3 webhook.py
+Проверка без Telegram (WEBHOOK_URL не задан - webhook не регистрируется):
+    curl -X POST -H 'Content-Type: application/json' -d @update.json http://localhost:8080/webhook
+"""
+import os
+import asyncio
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес, например https://bot.example.com
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', os.cpu_count() or 1))
+# Сколько апдейтов разных пользователей обрабатывается одновременно в одном процессе
+WEBHOOK_WORKER_CONCURRENCY = int(os.getenv('WEBHOOK_WORKER_CONCURRENCY', 100))
+
+
+def routing_key(update: Dict[str, Any]) -> int:
+    """Пользователь, к которому относится апдейт (или чат, если пользователя нет)"""
+    for field, payload in update.items():
+        if field == 'update_id' or not isinstance(payload, dict):
+            continue
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+    return update.get('update_id', 0)
+
+
+def worker_for(update: Dict[str, Any], workers: int) -> int:
+    return routing_key(update) % workers
+
+
+# ---- Процесс-обработчик ----
+
+async def _process_updates(index: int, workers: int, queue: multiprocessing.Queue):
+    from run import create_bot, create_dispatcher, start_services, shutdown
+    from app.database.pool import create_pool
+    from app.database.rates import load_rates
+
+    await create_pool()
+    await load_rates()
+    bot = create_bot()
+    dp = create_dispatcher()
+    # Лимит отправки бота делится между процессами
+    start_services(
+        bot,
+        global_jobs=index == 0,
+        shard=index,
+        shards=workers,
+        global_rate=float(os.getenv('SENDER_GLOBAL_RATE', 25)) / workers,
+        global_burst=max(1.0, float(os.getenv('SENDER_GLOBAL_BURST', 30)) / workers),
+    )
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(WEBHOOK_WORKER_CONCURRENCY)
+    # Последний апдейт каждого пользователя: следующий ждёт его завершения
+    tails: Dict[int, asyncio.Task] = {}
+
+    async def handle(update: Dict[str, Any], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        async with slots:
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                print(f"Обработчик {index}: ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    def forget(key: int, task: asyncio.Task):
+        if tails.get(key) is task:
+            del tails[key]
+
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            key = routing_key(update)
+            task = asyncio.create_task(handle(update, tails.get(key)))
+            tails[key] = task
+            task.add_done_callback(lambda done, key=key: forget(key, done))
+        # Дорабатываем принятые апдейты
+        await asyncio.gather(*tails.values(), return_exceptions=True)
+    finally:
+        await shutdown(dp, bot)
+
+
+def _worker_main(index: int, workers: int, queue: multiprocessing.Queue):
+    try:
+        asyncio.run(_process_updates(index, workers, queue))
+    except KeyboardInterrupt:
+        pass
+
+
+# ---- Основной процесс ----
+
+def create_app(queues: List[multiprocessing.Queue]) -> web.Application:
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = await request.json()
+        queues[worker_for(update, len(queues))].put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    return app
+
+
+async def _prepare():
+    """Миграции и регистрация webhook выполняются один раз в основном процессе"""
+    from run import create_bot, init_database
+    from app.database.pool import close_pool
+
+    if not await init_database():
+        return False
+    await close_pool()
+
+    if WEBHOOK_URL:
+        bot = create_bot()
+        try:
+            await bot.set_webhook(WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                                  secret_token=WEBHOOK_SECRET, drop_pending_updates=True)
+        finally:
+            await bot.session.close()
+    return True
+
+
+def main():
+    if not asyncio.run(_prepare()):
+        return
+
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(WEBHOOK_WORKERS)]
+    processes = [
+        context.Process(target=_worker_main, args=(index, WEBHOOK_WORKERS, queue), daemon=False)
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Webhook: {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}, обработчиков: {WEBHOOK_WORKERS}")
+
+    try:
+        web.run_app(create_app(queues), host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)
+    finally:
+        # Обработчики завершают принятые апдейты и останавливаются
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()